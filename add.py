@@ -1,4 +1,23 @@
 import csv
+import hashlib
+import json
+import os
+import re
+import sys
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def _format_entry(question, answer):
+    return f"""
+<details><summary>{question}</summary>
+{answer}
+</details>
+"""
 
 
 def add_qa_to_md(filename="qa.md"):
@@ -14,79 +33,217 @@ def add_qa_to_md(filename="qa.md"):
                 
             answer = input("Введите ответ: ").strip()
             
-            md_entry = f"""
-<details><summary>{question}</summary>
-{answer}
-</details>
-"""
-            md_file.write(md_entry)
+            md_file.write(_format_entry(question, answer))
             print(f"Добавлено в {filename}!")
     
     print(f"\nГотово! Результаты сохранены в {filename}")
 
 
-def parse_without_regex(md_filename, csv_filename):
-    with open(md_filename, 'r', encoding='utf-8') as md_file:
-        lines = md_file.readlines()
-    
-    qa_pairs = []
-    i = 0
-    while i < len(lines):
-        if lines[i].startswith('<details><summary>'):
-            question = lines[i].replace('<details><summary>', '').replace('</summary>', '').strip()
-            answer_lines = []
-            i += 1
-            while i < len(lines) and not lines[i].strip().startswith('</details>'):
-                answer_lines.append(lines[i].strip())
-                i += 1
-            answer = ' '.join(answer_lines)
-            qa_pairs.append((question, answer))
-        i += 1
-    
-    with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
+_TAG_RE = re.compile(r"(</?(?:details|summary)\b[^>]*>)", re.I)
+_HEADING_RE = re.compile(r"#{1,6}\s+(.*)")
+
+
+def _clean_question(text):
+    return " ".join(text.split()).strip("* ")
+
+
+def iter_qa_pairs(lines):
+    """Потоково достает пары (вопрос, ответ) из строк markdown.
+
+    Понимает оба формата банков, даже вперемешку в одном файле:
+    блоки <details><summary>вопрос</summary>ответ</details> (теги могут
+    стоять где угодно в строке и переноситься) и заголовки как в
+    questions.md, где ответ - текст до следующего заголовка.
+    Переносы строк и блоки кода в ответе сохраняются; в памяти держится
+    только текущий ответ."""
+    mode = None  # None | "details" | "summary" | "answer" | "heading"
+    question, summary, answer = None, [], []
+    in_code = False
+
+    def pair():
+        text = "".join(answer).strip()
+        if question and text:
+            yield question, text
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_code = not in_code
+        elif not in_code and mode in (None, "heading") and (m := _HEADING_RE.match(stripped)):
+            yield from pair()
+            mode, question, answer = "heading", _clean_question(m.group(1)), []
+            continue
+
+        if in_code or stripped.startswith("```"):
+            if mode in ("answer", "heading"):
+                answer.append(line + "\n")
+            continue
+
+        for piece in _TAG_RE.split(line):
+            tag = piece.lower()
+            if tag.startswith("<details"):
+                if mode == "heading":
+                    yield from pair()
+                mode, question, answer = "details", None, []
+            elif tag.startswith("<summary") and mode == "details":
+                mode, summary = "summary", []
+            elif tag == "</summary>" and mode == "summary":
+                mode, question = "answer", _clean_question(" ".join(summary))
+            elif tag == "</details>" and mode in ("answer", "details"):
+                yield from pair()
+                mode, question, answer = None, None, []
+            elif mode == "summary":
+                summary.append(piece)
+            elif mode in ("answer", "heading"):
+                answer.append(piece)
+        if mode in ("answer", "heading"):
+            answer.append("\n")
+
+    if mode == "heading":
+        yield from pair()
+
+
+def _write_csv(pairs, filename):
+    count = 0
+    with open(filename, 'w', newline='', encoding='utf-8') as csv_file:
         writer = csv.writer(csv_file)
         writer.writerow(['Question', 'Answer'])
-        writer.writerows(qa_pairs)
-    
-    print(f"Спаршено {len(qa_pairs)} вопросов. Результат в {csv_filename}")
+        for count, row in enumerate(pairs, 1):
+            writer.writerow(row)
+    return count
 
 
+def _write_jsonl(pairs, filename):
+    count = 0
+    with open(filename, 'w', encoding='utf-8') as jsonl_file:
+        for count, (question, answer) in enumerate(pairs, 1):
+            record = {"question": question, "answer": answer}
+            jsonl_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return count
+
+
+def _write_parquet(pairs, filename, batch_size=10_000):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Для Parquet нужен pyarrow: pip install pyarrow")
+
+    schema = pa.schema([("question", pa.string()), ("answer", pa.string())])
+    count = 0
+    pairs = iter(pairs)
+    with pq.ParquetWriter(filename, schema) as writer:
+        while batch := list(islice(pairs, batch_size)):
+            questions, answers = zip(*batch)
+            writer.write_table(pa.table([list(questions), list(answers)], schema=schema))
+            count += len(batch)
+    return count
+
+
+WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl, "parquet": _write_parquet}
+
+
+def convert_md(md_filename, out_filename, fmt=None):
+    """Конвертирует банк вопросов в CSV/JSONL/Parquet построчно, не читая файл целиком.
+
+    Формат вывода по умолчанию берется из расширения out_filename."""
+    fmt = fmt or str(out_filename).rsplit('.', 1)[-1].lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Неизвестный формат {fmt!r}, доступны: {', '.join(WRITERS)}")
+
+    with open(md_filename, 'r', encoding='utf-8') as md_file:
+        count = WRITERS[fmt](iter_qa_pairs(md_file), out_filename)
+
+    print(f"Спаршено {count} вопросов. Результат в {out_filename}")
+    return count
+
+
+def parse_without_regex(md_filename, csv_filename):
+    return convert_md(md_filename, csv_filename, fmt="csv")
+
+
+def _question_key(question):
+    """Ключ для поиска дублей: регистр и пробелы не важны, в индексе - 16 байт md5."""
+    return hashlib.md5(" ".join(question.casefold().split()).strip("* ").encode()).digest()
+
+
+def _read_qa_rows(filename):
+    """Пары (вопрос, ответ) из CSV (первые две колонки) или JSONL (question/answer)."""
+    with open(filename, 'r', newline='', encoding='utf-8') as src:
+        if str(filename).lower().endswith(('.jsonl', '.ndjson')):
+            for line in src:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record.get("question") or record.get("Question"), \
+                        record.get("answer") or record.get("Answer")
+            return
+        rows = csv.reader(src)
+        for row in rows:
+            if len(row) < 2:
+                continue
+            if rows.line_num == 1 and row[0].strip().lower() in ("question", "вопрос"):
+                continue
+            yield row[0], row[1]
+
+
+def add_qa_bulk(source, filename="qa.md"):
+    """Пакетно добавляет вопросы из CSV/JSONL в markdown файл.
+
+    Индекс уже имеющихся вопросов строится один раз, дубли (и в файле, и внутри
+    source) пропускаются. Все новые записи дописываются одним write под
+    эксклюзивной блокировкой файла, так что параллельные запуски не смешают
+    записи, а сбой посреди импорта не оставит половину пакета."""
+    with open(filename, "a+", encoding="utf-8") as md_file:
+        if fcntl is not None:
+            fcntl.flock(md_file, fcntl.LOCK_EX)
+        md_file.seek(0)
+        seen = {_question_key(question) for question, _ in iter_qa_pairs(md_file)}
+
+        entries, skipped = [], 0
+        for question, answer in _read_qa_rows(source):
+            question, answer = (question or "").strip(), (answer or "").strip()
+            key = _question_key(question)
+            if not question or not answer or key in seen:
+                skipped += 1
+                continue
+            seen.add(key)
+            entries.append(_format_entry(question, answer))
+
+        if entries:
+            md_file.write("".join(entries))
+            md_file.flush()
+            os.fsync(md_file.fileno())
+
+    print(f"Добавлено {len(entries)} вопросов в {filename}, пропущено {skipped}")
+    return len(entries), skipped
 
-# def parse_without_regex(md_filename, csv_filename):
-#     with open(md_filename, 'r', encoding='utf-8') as md_file:
-#         lines = md_file.readlines()
-    
-#     qa_pairs = []
-#     i = 0
-#     while i < len(lines):
-#         if lines[i].startswith('<details><summary>'):
-#             # Извлекаем вопрос
-#             question = lines[i].replace('<details><summary>', '').replace('</summary>', '').strip()
-            
-#             # Извлекаем ответ с сохранением переносов строк
-#             answer_lines = []
-#             i += 1
-#             while i < len(lines) and not lines[i].strip().startswith('</details>'):
-#                 answer_lines.append(lines[i].rstrip('\n'))  # Удаляем только символы новой строки в конце
-#                 i += 1
-            
-#             # Объединяем строки ответа с сохранением переносов
-#             answer = '\n'.join(answer_lines).strip()
-#             qa_pairs.append((question, answer))
-#         i += 1
-    
-#     # Записываем в CSV с экранированием переносов строк
-#     with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
-#         writer = csv.writer(csv_file, quoting=csv.QUOTE_ALL)  # QUOTE_ALL чтобы все значения были в кавычках
-#         writer.writerow(['Question', 'Answer'])
-#         for question, answer in qa_pairs:
-#             # Заменяем переносы строк на специальный маркер, если нужно
-#             # Или просто записываем как есть (CSV поддерживает переносы в кавычках)
-#             writer.writerow([question, answer])
-    
-#     print(f"Спаршено {len(qa_pairs)} вопросов. Результат в {csv_filename}")
 
 # Запуск функции
 if __name__ == "__main__":
-    # add_qa_to_md()
-    parse_without_regex("PYTHON_BASE.md", "test.csv")
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Работа с банками вопросов в markdown")
+    commands = parser.add_subparsers(dest="command")
+
+    add_cmd = commands.add_parser("add", help="интерактивно дописать вопросы в файл")
+    add_cmd.add_argument("filename", nargs="?", default="qa.md")
+
+    bulk_cmd = commands.add_parser("bulk", help="добавить вопросы из CSV/JSONL без дублей")
+    bulk_cmd.add_argument("source")
+    bulk_cmd.add_argument("filename", nargs="?", default="qa.md")
+
+    convert_cmd = commands.add_parser("convert", help="выгрузить вопросы в CSV/JSONL/Parquet")
+    convert_cmd.add_argument("md", nargs="?", default="PYTHON_BASE.md")
+    convert_cmd.add_argument("out", nargs="?", default="test.csv")
+    convert_cmd.add_argument("-f", "--format", choices=sorted(WRITERS),
+                             help="по умолчанию - по расширению файла")
+
+    args = parser.parse_args()
+    if args.command == "add":
+        add_qa_to_md(args.filename)
+    elif args.command == "bulk":
+        add_qa_bulk(args.source, args.filename)
+    else:
+        convert_md(getattr(args, "md", "PYTHON_BASE.md"), getattr(args, "out", "test.csv"),
+                   getattr(args, "format", None))
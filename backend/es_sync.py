@@ -0,0 +1,248 @@
+"""
+Синхронизация коллекции questions из MongoDB в Elasticsearch.
+
+    python es_sync.py                # change streams, если Mongo в replica set, иначе опрос
+    python es_sync.py --mode poll    # принудительно опрос по updated_at
+
+Change streams отдают вставки, правки и удаления вместе с resume token;
+без replica set воркер опрашивает коллекцию по updated_at, а удаления находит
+периодической сверкой id. Изменения копятся пачками и уходят в ES одним
+bulk-запросом; чекпоинт (resume token или последний updated_at) сохраняется
+в коллекции sync_state только после успешной записи пачки, так что после
+рестарта воркер продолжает с места остановки без полной переиндексации.
+Временные ошибки ES (429, 5xx) переотправляются; если они не проходят и после
+FLUSH_RETRIES попыток, чекпоинт сохраняется только до первого неудачного
+изменения, и воркер останавливается, чтобы не проскочить его следующей пачкой.
+Документы, которые ES отвергает насовсем (ошибка mapping и т.п.), пишутся в лог
+и пропускаются: при повторе они бы не прошли все равно.
+
+Индекс лучше заранее создать через /elastic/create_index демо-приложения ES,
+чтобы он получил правильный mapping.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_scan, async_streaming_bulk
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+ELASTIC_URL = os.getenv("ELASTIC_URL", "http://localhost:9200")
+ES_INDEX = os.getenv("ES_INDEX", "questions")
+SYNC_ID = "questions->elasticsearch"
+
+BATCH_SIZE = 500           # документов в одном bulk-запросе
+FLUSH_INTERVAL = 1.0       # максимум секунд ожидания неполной пачки
+QUEUE_SIZE = 5000          # буфер между Mongo и ES; заполнен - чтение Mongo ждет
+POLL_INTERVAL = 1.0        # период опроса без change streams
+RECONCILE_INTERVAL = 300   # период поиска удаленных документов при опросе
+FLUSH_RETRIES = 5          # повторов временно не записанных изменений пачки
+RETRY_BACKOFF = 1.0        # пауза перед первым повтором, сек (растет x2)
+
+log = logging.getLogger("es_sync")
+
+
+def to_es_doc(question: dict) -> dict:
+    """Документ вопроса в формате индекса ES"""
+    return {
+        "question": question.get("question_text"),
+        "content": question.get("answer_text"),
+        "tags": question.get("tags", []),
+        "difficulty": question.get("difficulty"),
+        "category": str(question["category_id"]) if question.get("category_id") else None,
+    }
+
+
+def index_action(question: dict) -> dict:
+    return {"_op_type": "index", "_index": ES_INDEX, "_id": str(question["_id"]),
+            "_source": to_es_doc(question)}
+
+
+def delete_action(doc_id) -> dict:
+    return {"_op_type": "delete", "_index": ES_INDEX, "_id": str(doc_id)}
+
+
+class SyncError(RuntimeError):
+    pass
+
+
+class ESSync:
+    def __init__(self, db, es: AsyncElasticsearch, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, queue_size=QUEUE_SIZE):
+        self.questions = db.questions
+        self.state = db.sync_state
+        self.es = es
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # (action, checkpoint); checkpoint=None - действие без своей позиции (бэкфилл, сверка)
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+
+    # ---------- чекпоинт ----------
+    async def load_checkpoint(self) -> dict:
+        return await self.state.find_one({"_id": SYNC_ID}) or {}
+
+    async def save_checkpoint(self, checkpoint: dict):
+        await self.state.update_one({"_id": SYNC_ID}, {"$set": checkpoint}, upsert=True)
+
+    # ---------- источники изменений ----------
+    async def backfill(self):
+        """Полная заливка - только при самом первом запуске, когда чекпоинта еще нет"""
+        async for question in self.questions.find():
+            await self.queue.put((index_action(question), None))
+
+    async def tail_change_stream(self, checkpoint: dict):
+        resume_token = checkpoint.get("resume_token")
+        async with self.questions.watch(full_document="updateLookup",
+                                        resume_after=resume_token) as stream:
+            if resume_token is None:
+                # поток открыт до бэкфилла, поэтому правки во время заливки не потеряются;
+                # позиция потока станет чекпоинтом только после всей заливки
+                start_token = stream.resume_token
+                await self.backfill()
+                await self.queue.put((None, {"resume_token": start_token}))
+            log.info("Слушаем change stream")
+            async for change in stream:
+                op = change["operationType"]
+                if op in ("insert", "update", "replace") and change.get("fullDocument"):
+                    action = index_action(change["fullDocument"])
+                elif op == "delete":
+                    action = delete_action(change["documentKey"]["_id"])
+                else:
+                    continue
+                await self.queue.put((action, {"resume_token": change["_id"]}))
+
+    async def poll(self, checkpoint: dict):
+        await self.questions.create_index([("updated_at", 1), ("_id", 1)])
+        # без чекпоинта опрос с datetime.min сам выполняет первую заливку
+        last_at = checkpoint.get("updated_at", datetime.min)
+        last_id = checkpoint.get("last_id")
+        next_reconcile = time.monotonic() + RECONCILE_INTERVAL
+        log.info("Change streams недоступны, опрашиваем updated_at раз в %s с", POLL_INTERVAL)
+        while True:
+            query = {"$or": [{"updated_at": {"$gt": last_at}},
+                             {"updated_at": last_at, "_id": {"$gt": last_id}}]}
+            if last_id is None:
+                query = {"updated_at": {"$gte": last_at}}
+            cursor = self.questions.find(query).sort([("updated_at", 1), ("_id", 1)])
+            async for question in cursor:
+                last_at, last_id = question["updated_at"], question["_id"]
+                await self.queue.put((index_action(question),
+                                      {"updated_at": last_at, "last_id": last_id}))
+            if time.monotonic() >= next_reconcile:
+                await self.reconcile_deletes()
+                next_reconcile = time.monotonic() + RECONCILE_INTERVAL
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def reconcile_deletes(self):
+        """Удаляет из ES документы, которых больше нет в Mongo (для режима опроса)"""
+        # сначала ES, потом Mongo: вопрос, созданный между двумя чтениями, не удалится
+        es_ids = [hit["_id"] async for hit in
+                  async_scan(self.es, index=ES_INDEX, query={"_source": False})]
+        mongo_ids = {str(doc["_id"]) async for doc in self.questions.find({}, {"_id": 1})}
+        for doc_id in es_ids:
+            if doc_id not in mongo_ids:
+                await self.queue.put((delete_action(doc_id), None))
+
+    # ---------- запись в ES ----------
+    async def next_batch(self):
+        """Ждет первое изменение, затем добирает пачку до batch_size или flush_interval"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def send(self, actions) -> set:
+        """Один bulk; возвращает (op, _id) изменений, которые стоит повторить"""
+        retry, rejected = set(), 0
+        async for ok, item in async_streaming_bulk(self.es, actions, chunk_size=self.batch_size,
+                                                   raise_on_error=False, max_retries=3):
+            op, result = next(iter(item.items()))
+            status = result.get("status", 0)
+            # удаление того, чего в индексе уже нет, - не ошибка
+            if ok or result.get("result") == "not_found" or status == 404:
+                continue
+            if status == 429 or status >= 500:
+                retry.add((op, result.get("_id")))
+            else:
+                rejected += 1
+            log.error("Ошибка синхронизации %s: %s", result.get("_id"), result.get("error"))
+        if rejected:
+            log.error("ES отверг %d изменений, они пропущены", rejected)
+        return retry
+
+    async def flush(self, batch):
+        pending = [(i, action) for i, (action, _) in enumerate(batch) if action is not None]
+        sent = len(pending)
+        for attempt in range(FLUSH_RETRIES + 1):
+            if attempt:
+                log.warning("Повтор %d изменений (%d из %d)", len(pending), attempt, FLUSH_RETRIES)
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            retry = await self.send([action for _, action in pending])
+            pending = [(i, action) for i, action in pending
+                       if (action["_op_type"], action["_id"]) in retry]
+            if not pending:
+                break
+
+        # чекпоинт не должен уйти дальше первого незаписанного изменения
+        stop = pending[0][0] if pending else len(batch)
+        checkpoints = [cp for _, cp in batch[:stop] if cp is not None]
+        if checkpoints:
+            await self.save_checkpoint(checkpoints[-1])
+        if pending:
+            raise SyncError(f"{len(pending)} изменений не записано в ES после "
+                            f"{FLUSH_RETRIES} повторов; чекпоинт сохранен до первого из них")
+        log.info("В ES отправлено %d изменений", sent)
+
+    async def consume(self):
+        while True:
+            await self.flush(await self.next_batch())
+
+    async def run(self, mode="auto"):
+        checkpoint = await self.load_checkpoint()
+        if mode == "auto":
+            try:
+                async with self.questions.watch() as stream:
+                    await stream.try_next()
+                mode = "stream"
+            except OperationFailure:  # standalone Mongo, не replica set
+                mode = "poll"
+        source = self.tail_change_stream(checkpoint) if mode == "stream" else self.poll(checkpoint)
+        tasks = {asyncio.create_task(source), asyncio.create_task(self.consume())}
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+
+
+async def main(mode):
+    client = AsyncIOMotorClient(MONGODB_URL)
+    es = AsyncElasticsearch(
+        ELASTIC_URL,
+        basic_auth=(os.getenv("ELASTIC_USERNAME", "elastic"), os.getenv("ELASTIC_PASSWORD")),
+    )
+    try:
+        await ESSync(client.interview_db, es).run(mode)
+    finally:
+        await es.close()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синхронизация вопросов MongoDB -> Elasticsearch")
+    parser.add_argument("--mode", choices=("auto", "stream", "poll"), default="auto")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(main(args.mode))
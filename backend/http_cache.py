@@ -0,0 +1,98 @@
+"""
+HTTP-кеширование списков для FastAPI: ETag, 304 и серверный кеш ответов.
+
+Каждой коллекции соответствует счетчик версии в коллекции cache_versions.
+Любой успешный POST/PUT/DELETE по маршрутам коллекции увеличивает счетчик,
+а ETag ответа строится из версий нужных коллекций и нормализованного запроса.
+Поэтому If-None-Match проверяется одним чтением по _id, без запроса самих
+данных, а закешированный на сервере ответ отдается, пока версия не сменилась.
+Счетчики лежат в Mongo, так что инвалидация работает и при нескольких воркерах.
+"""
+import hashlib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    pattern: str                      # регулярное выражение для пути
+    collections: Sequence[str] = ()   # от каких коллекций зависит ответ
+    cache_control: str = "no-store"
+
+    def matches(self, path: str) -> bool:
+        return re.match(self.pattern, path) is not None
+
+
+class HttpCache:
+    def __init__(self, db, policies: Sequence[CachePolicy], maxsize: int = 512):
+        self.versions = db.cache_versions
+        self.policies = policies
+        self.maxsize = maxsize
+        self._responses: "OrderedDict[str, Tuple[str, bytes, str]]" = OrderedDict()
+
+    def policy_for(self, path: str) -> Optional[CachePolicy]:
+        return next((p for p in self.policies if p.matches(path)), None)
+
+    async def version(self, collections: Sequence[str]) -> str:
+        found = {doc["_id"]: doc["v"] async for doc in
+                 self.versions.find({"_id": {"$in": list(collections)}})}
+        return ",".join(f"{name}:{found.get(name, 0)}" for name in collections)
+
+    async def bump(self, collections: Sequence[str]):
+        for name in collections:
+            await self.versions.update_one({"_id": name}, {"$inc": {"v": 1}}, upsert=True)
+
+    @staticmethod
+    def cache_key(request: Request) -> str:
+        # порядок параметров не важен: ?a=1&b=2 и ?b=2&a=1 - один ключ
+        query = urlencode(sorted(parse_qsl(request.url.query, keep_blank_values=True)))
+        return f"{request.url.path}?{query}"
+
+    def _remember(self, key: str, version: str, body: bytes, media_type: str):
+        self._responses[key] = (version, body, media_type)
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.maxsize:
+            self._responses.popitem(last=False)
+
+    async def __call__(self, request: Request, call_next):
+        policy = self.policy_for(request.url.path)
+        if policy is None:
+            return await call_next(request)
+
+        if request.method != "GET":
+            response = await call_next(request)
+            if response.status_code < 400 and policy.collections:
+                await self.bump(policy.collections)
+            return response
+
+        if not policy.collections:
+            response = await call_next(request)
+            response.headers["Cache-Control"] = policy.cache_control
+            return response
+
+        key = self.cache_key(request)
+        version = await self.version(policy.collections)
+        etag = 'W/"%s"' % hashlib.md5(f"{version}|{key}".encode()).hexdigest()
+        headers = {"ETag": etag, "Cache-Control": policy.cache_control}
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match == "*":
+            return Response(status_code=304, headers=headers)
+
+        cached = self._responses.get(key)
+        if cached is not None and cached[0] == version:
+            return Response(content=cached[1], media_type=cached[2], headers=headers)
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        media_type = response.headers.get("content-type", "application/json")
+        self._remember(key, version, body, media_type)
+        return Response(content=body, status_code=200, media_type=media_type, headers=headers)
@@ -9,6 +9,8 @@ from bson import ObjectId
 import os
 from pydantic_core import core_schema
 
+from http_cache import CachePolicy, HttpCache
+
 app = FastAPI(
     title="IT Interview Questions API",
     description="API для базы вопросов и ответов на IT собеседования с MongoDB",
@@ -22,6 +24,13 @@ db = client.interview_db
 categories_collection = db.categories
 questions_collection = db.questions
 
+# HTTP-кеш: ETag/304 и кеш ответов; записи по маршруту сбрасывают версию коллекции
+app.middleware("http")(HttpCache(db, [
+    CachePolicy(r"/questions/random/"),
+    CachePolicy(r"/(questions|search)/", ("questions",), "public, max-age=30, must-revalidate"),
+    CachePolicy(r"/categories/", ("categories",), "public, max-age=300, must-revalidate"),
+]))
+
 # Модели данных
 class PyObjectId(str):
     @classmethod
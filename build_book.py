@@ -0,0 +1,317 @@
+"""
+Сборка книги из questions.md: epub и одностраничный HTML.
+
+    python3 build_book.py                  # epub и html
+    python3 build_book.py epub -j 4
+
+Банк делится на главы по заголовкам первого уровня (`# ...` вне блоков кода).
+Каждая глава отдельно разбирается pandoc в JSON AST в пуле процессов, и
+результат кешируется в .book_cache/ по хешу текста главы, версии pandoc и
+аргументов. Затем AST глав склеиваются, и из склейки одним вызовом pandoc
+пишутся выходные файлы. Правка одного ответа перезапускает разбор только
+одной главы, а если не изменилось ничего - не вызывается и финальная сборка.
+
+Картинки из questions.md и обложка перед разбором пережимаются без потерь
+(слишком широкие - уменьшаются до MAX_IMAGE_WIDTH) в .book_cache/assets/ с
+кешем по хешу содержимого, и ссылки в главах переписываются на эти копии.
+Для этого нужен Pillow; без него картинки попадают в книгу как есть.
+Выходные файлы самодостаточны: epub и так содержит картинки, а HTML
+собирается с --embed-resources (pandoc 2.19+).
+Изображения, на которые не ссылается ни один .md файл репозитория,
+выводятся предупреждением.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import unquote
+
+SOURCE = Path('questions.md')
+METADATA = Path('metadata.txt')
+STYLESHEET = Path('book_res/style.css')
+COVER = Path('book_res/cover.png')
+CACHE_DIR = Path('.book_cache')
+ASSET_DIR = CACHE_DIR / 'assets'
+
+IMAGE_DIRS = (Path('.'), Path('attachments'), Path('book_res'))
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+MAX_IMAGE_WIDTH = 1600  # шире экраны читалок все равно не покажут
+
+READ_ARGS = ['-f', 'markdown', '-t', 'json']
+OUTPUTS = {
+    'epub': (Path('questions.epub'), ['--toc', '--toc-depth=6']),
+    # картинки лежат в .book_cache/assets, который чистится при каждой сборке,
+    # поэтому HTML встраивает их (и стили) в себя
+    'html': (Path('questions.html'), ['--toc', '--toc-depth=6', '--standalone',
+                                      '--embed-resources', '--css', str(STYLESHEET)]),
+}
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """Делит markdown на главы (заголовок, текст) по `# ` вне блоков кода.
+
+    Текст до первого заголовка попадает в первую главу."""
+    sections = []
+    title, lines = None, []
+    in_code = False
+    for line in text.splitlines(keepends=True):
+        if line.lstrip().startswith('```'):
+            in_code = not in_code
+        elif not in_code and line.startswith('# '):
+            if title is not None:
+                sections.append((title, ''.join(lines)))
+                lines = []
+            title = line[2:].strip()
+        lines.append(line)
+    if lines:
+        sections.append((title or '', ''.join(lines)))
+    return sections
+
+
+def pandoc_version() -> str:
+    result = subprocess.run(['pandoc', '--version'], capture_output=True, text=True, check=True)
+    return result.stdout.splitlines()[0]
+
+
+def digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def file_hashes(paths: Iterable[Path]) -> List[str]:
+    """sha256 содержимого файлов, которые pandoc прочитает при финальной сборке"""
+    return [f'{p}:{hashlib.sha256(p.read_bytes()).hexdigest()}'
+            for p in sorted(set(paths)) if p.is_file()]
+
+
+def convert_section(text: str, cache_path: Path) -> Path:
+    """Разбирает главу в JSON AST; запускается в процессе пула"""
+    if not cache_path.exists():
+        result = subprocess.run(['pandoc', *READ_ARGS], input=text, capture_output=True,
+                                text=True, encoding='utf-8', check=True)
+        tmp = cache_path.with_suffix('.part')
+        tmp.write_text(result.stdout, encoding='utf-8')
+        tmp.replace(cache_path)
+    return cache_path
+
+
+# ![alt](path "title"), <img src="path"> и обсидиановское ![[name]]
+_MD_IMAGE_RE = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)')
+_HTML_IMAGE_RE = re.compile(r'<img\b[^>]*?\bsrc=["\']([^"\']+)', re.I)
+_WIKI_IMAGE_RE = re.compile(r'!\[\[([^\]|#]+)')
+
+
+def _is_local(ref: str) -> bool:
+    return '://' not in ref and not ref.startswith('data:')
+
+
+def image_refs(text: str) -> List[str]:
+    """Локальные пути картинок из markdown/HTML-ссылок"""
+    return [m.group(1) for regex in (_MD_IMAGE_RE, _HTML_IMAGE_RE)
+            for m in regex.finditer(text) if _is_local(m.group(1))]
+
+
+def rewrite_image_refs(text: str, mapping: Dict[str, str]) -> str:
+    def replace(m):
+        new = mapping.get(m.group(1))
+        if new is None:
+            return m.group(0)
+        start, end = m.start(1) - m.start(), m.end(1) - m.start()
+        return m.group(0)[:start] + new + m.group(0)[end:]
+
+    for regex in (_MD_IMAGE_RE, _HTML_IMAGE_RE):
+        text = regex.sub(replace, text)
+    return text
+
+
+def have_pillow() -> bool:
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def optimize_image(src: Path) -> Path:
+    """Пережимает картинку в ASSET_DIR; запускается в процессе пула.
+
+    Имя копии - хеш содержимого и параметров, так что повторная сборка
+    только проверяет наличие файла."""
+    from PIL import Image
+
+    data = src.read_bytes()
+    key = hashlib.sha256(data + f'|{MAX_IMAGE_WIDTH}|lossless'.encode()).hexdigest()[:20]
+    out = ASSET_DIR / f'{key}{src.suffix.lower()}'
+    if out.exists():
+        return out
+
+    tmp = out.with_name(out.name + '.part')
+    with Image.open(src) as img:
+        if getattr(img, 'n_frames', 1) > 1:
+            # анимацию Pillow пересохранит только первым кадром - копируем как есть
+            tmp.write_bytes(data)
+            tmp.replace(out)
+            return out
+        fmt = img.format
+        options = {'optimize': True}
+        if fmt == 'JPEG':
+            options.update(progressive=True, quality='keep')
+        elif fmt == 'WEBP':
+            options['lossless'] = True  # по умолчанию Pillow пишет WebP с потерями
+        resized = img.width > MAX_IMAGE_WIDTH
+        if resized:
+            height = round(img.height * MAX_IMAGE_WIDTH / img.width)
+            img = img.resize((MAX_IMAGE_WIDTH, height), Image.LANCZOS)
+            if fmt == 'JPEG':
+                options['quality'] = 90
+        img.save(tmp, format=fmt, **options)
+    if not resized and tmp.stat().st_size >= len(data):
+        tmp.write_bytes(data)  # уже сжата лучше, чем умеет Pillow
+    tmp.replace(out)
+    return out
+
+
+def optimize_images(pool, paths: Iterable[Path]) -> Dict[Path, Path]:
+    paths = sorted({p for p in paths if p.suffix.lower() in IMAGE_SUFFIXES and p.is_file()})
+    if not paths:
+        return {}
+    ASSET_DIR.mkdir(parents=True, exist_ok=True)
+    result = dict(zip(paths, pool.map(optimize_image, paths)))
+    before = sum(p.stat().st_size for p in result)
+    after = sum(p.stat().st_size for p in result.values())
+    print(f'Картинок: {len(result)}, {before // 1024} КБ -> {after // 1024} КБ')
+    return result
+
+
+def find_orphan_images(root=Path('.')) -> List[Path]:
+    """Картинки из IMAGE_DIRS, на которые не ссылается ни один .md в репозитории"""
+    paths, names = {COVER.resolve()}, set()
+    for md in root.rglob('*.md'):
+        if any(part.startswith('.') for part in md.parts):
+            continue
+        text = md.read_text(encoding='utf-8', errors='ignore')
+        for ref in image_refs(text):
+            paths.add((md.parent / unquote(ref)).resolve())
+        names.update(m.group(1).strip() for m in _WIKI_IMAGE_RE.finditer(text))
+    return [image for d in IMAGE_DIRS for image in sorted(d.iterdir())
+            if image.suffix.lower() in IMAGE_SUFFIXES
+            and image.resolve() not in paths and image.name not in names]
+
+
+def _walk_headers(node, seen):
+    """Делает id заголовков уникальными по всей книге, как pandoc для одного файла"""
+    if isinstance(node, list):
+        for item in node:
+            _walk_headers(item, seen)
+    elif isinstance(node, dict):
+        if node.get('t') == 'Header':
+            attr = node['c'][1]
+            base = attr[0]
+            if base:
+                ident, n = base, 0
+                while ident in seen:
+                    n += 1
+                    ident = f'{base}-{n}'
+                seen.add(ident)
+                attr[0] = ident
+        _walk_headers(node.get('c'), seen)
+
+
+def merge_ast(paths: List[Path]) -> dict:
+    merged = None
+    for path in paths:
+        doc = json.loads(path.read_text(encoding='utf-8'))
+        if merged is None:
+            merged = doc
+        else:
+            merged['blocks'].extend(doc['blocks'])
+    _walk_headers(merged['blocks'], set())
+    return merged
+
+
+def build(formats, jobs=None, source=SOURCE):
+    CACHE_DIR.mkdir(exist_ok=True)
+    version = pandoc_version()
+    sections = split_sections(source.read_text(encoding='utf-8'))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        assets = {}
+        if have_pillow():
+            refs = {Path(unquote(ref)): ref for _, text in sections for ref in image_refs(text)}
+            optimized = optimize_images(pool, [COVER, *refs])
+            mapping = {ref: optimized[path].as_posix()
+                       for path, ref in refs.items() if path in optimized}
+            sections = [(title, rewrite_image_refs(text, mapping)) for title, text in sections]
+            assets = optimized
+        else:
+            print('Pillow не установлен, картинки не оптимизируются: pip install pillow')
+
+        keys = [digest(version, *READ_ARGS, text) for _, text in sections]
+        paths = [CACHE_DIR / f'{key}.json' for key in keys]
+        missing = [(text, path) for (_, text), path in zip(sections, paths) if not path.exists()]
+        if missing:
+            for path in pool.map(convert_section, *zip(*missing)):
+                print(f'  разобрана глава {path.name[:12]}')
+    print(f'Глав: {len(sections)}, перестроено: {len(missing)}')
+
+    for orphan in find_orphan_images():
+        print(f'Предупреждение: {orphan} нигде не используется')
+
+    cover = assets.get(COVER, COVER)
+    # без Pillow ссылки в главах не меняются вместе с картинками, поэтому
+    # содержимое картинок, обложки и стилей входит в ключ напрямую
+    images = [Path(unquote(ref)) for _, text in sections for ref in image_refs(text)]
+    book_key = digest(version, *keys, METADATA.read_text(encoding='utf-8'), str(cover),
+                      STYLESHEET.read_text(encoding='utf-8'),
+                      *file_hashes([cover, *images]))
+    merged_path = CACHE_DIR / f'book-{book_key}.json'
+    if not merged_path.exists():
+        merged_path.write_text(json.dumps(merge_ast(paths), ensure_ascii=False), encoding='utf-8')
+
+    for fmt in formats:
+        out, args = OUTPUTS[fmt]
+        if fmt == 'epub':
+            args = [*args, '--epub-cover-image', str(cover)]
+        stamp = CACHE_DIR / f'{fmt}.stamp'
+        out_key = digest(book_key, *args)
+        if out.exists() and stamp.exists() and stamp.read_text() == out_key:
+            print(f'{out} актуален')
+            continue
+        subprocess.run(['pandoc', '-f', 'json', str(merged_path), '--metadata-file', str(METADATA),
+                        *args, '-o', str(out)], check=True)
+        stamp.write_text(out_key)
+        print(f'Собран {out}')
+
+    # старые версии глав, склеек и картинок больше не понадобятся
+    keep = {p.name for p in paths} | {merged_path.name}
+    for path in CACHE_DIR.glob('*.json'):
+        if path.name not in keep:
+            path.unlink()
+    if assets:
+        keep = {p.name for p in assets.values()}
+        for path in ASSET_DIR.iterdir():
+            if path.name not in keep:
+                path.unlink()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сборка книги из questions.md')
+    parser.add_argument('formats', nargs='*', metavar='format',
+                        help=f"{', '.join(OUTPUTS)}; по умолчанию - все")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    if unknown := set(args.formats) - set(OUTPUTS):
+        parser.error(f"неизвестный формат: {', '.join(sorted(unknown))}")
+    try:
+        build(args.formats or sorted(OUTPUTS), args.jobs)
+    except FileNotFoundError as e:
+        sys.exit(f'Не найдено: {e.filename}')
@@ -1,107 +1,493 @@
 #!/usr/bin/env python3
 """
-md2speech_fast.py – многопроцессорный, кеширующий, без pydub
+md2speech_fast.py – асинхронный, кеширующий, без pydub
 """
-import re, hashlib, pathlib, subprocess, tempfile, multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import re, sys, json, bisect, hashlib, pathlib, asyncio, random, contextlib
 from tqdm import tqdm
 
 CACHE_DIR  = pathlib.Path("tts_cache")
 CACHE_DIR.mkdir(exist_ok=True)
 VOICES     = {"ru": "ru-RU-SvetlanaNeural", "en": "en-US-AriaNeural"}
-N_WORKERS  = min(12, mp.cpu_count())   # кол-во параллельных edge-tts
+N_CONCURRENT = 16      # одновременных запросов к движку синтеза
+RETRIES      = 3       # попыток на фрагмент
+BACKOFF      = 0.5     # базовая пауза между попытками, сек (растёт x2)
+BATCH_CHARS  = 4000    # максимум символов в одном запросе синтеза (0 – без пакетов)
+BATCH_CUT_EVERY = 64   # в среднем каждый 64-й абзац закрывает пакет по своему хешу (0 – не резать)
+# Чем реже срез, тем меньше запросов, но тем больше соседнего текста синтезируется
+# заново при правке одного абзаца. Нижнюю границу числа пакетов задают не срезы,
+# а смены языка и заголовки '#'/'##' (у каждого своя глава): для questions.md это
+# 827 абзацев -> 259 пакетов при срезе 16, 234 при 64 и 228 без срезов вовсе.
+BATCH_HEADING_LEVEL = 2  # заголовки '#' и '##' всегда начинают новый пакет
 
 # ---------- утилиты ----------
 def md5txt(text: str) -> str:
     return hashlib.md5(text.encode()).hexdigest()
 
+# ---------- язык ----------
+# В UTF-8 кириллица U+0400..U+047F начинается с байта 0xD0/0xD1, а латиница –
+# ASCII-буквы, поэтому считаем оба алфавита на уровне байтов, без списков и regex.
+_NOT_LATIN = bytes(b for b in range(256) if not chr(b).isascii() or not chr(b).isalpha())
+_LATIN_RUN = re.compile(r"[A-Za-z][^А-Яа-яЁё]*[A-Za-z][.!?:;,)\"']*")
+_CYR_RUN   = re.compile(r"[А-Яа-яЁё][^A-Za-z]*[А-Яа-яЁё][.!?:;,)\"']*")
+RU_SHARE        = 0.35  # доля кириллицы среди букв, с которой абзац читается русским голосом
+MIN_RUN_LETTERS = 24    # вставки другого алфавита короче этого читаются голосом абзаца
+
+def count_scripts(text: str) -> tuple[int, int]:
+    """(кириллических, латинских) букв в тексте."""
+    b = text.encode()
+    return b.count(0xD0) + b.count(0xD1), len(b.translate(None, _NOT_LATIN))
+
 def detect_lang(text: str) -> str:
-    return "ru" if len(re.findall(r"[а-яё]", text, re.I)) / max(len(text), 1) > 0.35 else "en"
+    cyr, lat = count_scripts(text)
+    return "ru" if cyr > RU_SHARE * (cyr + lat) else "en"
+
+def lang_runs(text: str) -> list[tuple[str, str]]:
+    """Режет смешанный абзац на куски по алфавиту: [(text, lang)].
 
-def split_md(md: str):
+    Короткие вставки (идентификаторы, термины) остаются в куске основного языка,
+    отдельным голосом читаются только длинные – от MIN_RUN_LETTERS букв."""
+    cyr, lat = count_scripts(text)
+    lang = "ru" if cyr > RU_SHARE * (cyr + lat) else "en"
+    minority, other, run_re = (lat, "en", _LATIN_RUN) if lang == "ru" else (cyr, "ru", _CYR_RUN)
+    if minority < MIN_RUN_LETTERS:
+        return [(text, lang)]
+    runs, pos = [], 0
+    for m in run_re.finditer(text):
+        if sum(count_scripts(m.group())) < MIN_RUN_LETTERS:
+            continue
+        runs += [(text[pos:m.start()], lang), (m.group(), other)]
+        pos = m.end()
+    runs.append((text[pos:], lang))
+    return [(t, lng) for t, lng in ((t.strip(), lng) for t, lng in runs) if re.search(r"[^\W\d_]", t)]
+
+def split_md(md: str, headings: bool = False):
+    """Абзацы текста; с headings=True заголовки тоже отдаются (строкой с '#')."""
     md = re.sub(r"```.*?```", "", md, flags=re.S)
     md = re.sub(r"`[^`]+`", "", md)
-    for p in re.split(r"\n{2,}", md.strip()):
-        if (p := p.strip()) and not p.startswith("#"):
-            yield p
+    md = re.sub(r"!\[[^\]]*\]\([^)]*\)", "", md)             # картинки
+    md = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", md)         # ссылки -> текст
+    md = re.sub(r"</?(?:details|summary)[^>]*>", "\n\n", md)   # вопрос – отдельный абзац
+    md = re.sub(r"\*\*|__", "", md)                             # жирный
+    for p in re.split(r"\n\s*\n", md.strip()):
+        if not (p := p.strip()) or not re.search(r"[^\W\d_]", p):  # нечего читать
+            continue
+        if p.startswith("#"):
+            head, _, p = p.partition("\n")
+            if headings:
+                yield head
+            if not (p := p.strip()):
+                continue
+        yield p
+
+# ---------- пакетирование ----------
+def split_sentences(text: str, max_chars: int):
+    """Режет слишком длинный абзац по границам предложений (в крайнем случае – по словам)."""
+    chunk = ""
+    for sent in re.split(r"(?<=[.!?…])\s+", text):
+        while len(sent) > max_chars:
+            cut = sent.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if chunk:
+                yield chunk
+                chunk = ""
+            yield sent[:cut].strip()
+            sent = sent[cut:].strip()
+        if chunk and len(chunk) + 1 + len(sent) > max_chars:
+            yield chunk
+            chunk = ""
+        chunk = f"{chunk} {sent}" if chunk else sent
+    if chunk:
+        yield chunk
+
+def batch_fragments(blocks, max_chars: int = BATCH_CHARS, cut_every: int = BATCH_CUT_EVERY):
+    """Склеивает соседние абзацы одного языка в пакеты до max_chars символов.
+
+    Смешанные абзацы предварительно режутся по алфавиту (lang_runs).
+    Границы пакетов зависят от содержимого (хеш абзаца, заголовок, смена языка),
+    а не от позиции в документе, поэтому правка одного абзаца меняет ключ кеша
+    только у его пакета – остальные по-прежнему берутся из tts_cache.
+    Отдаёт тройки (text, lang, heading), где heading – последний заголовок уровня
+    до BATCH_HEADING_LEVEL (такие заголовки всегда начинают новый пакет)."""
+    batch, batch_lang, size, heading = [], None, 0, None
+    for p in blocks:
+        if p.startswith("#"):
+            level = len(p) - len(p.lstrip("#"))
+            if level > BATCH_HEADING_LEVEL:
+                continue
+            if batch:
+                yield "\n\n".join(batch), batch_lang, heading
+            batch, batch_lang, size, heading = [], None, 0, p[level:].strip()
+            continue
+        for seg, lang in lang_runs(p):
+            parts = split_sentences(seg, max_chars) if max_chars and len(seg) > max_chars else (seg,)
+            for part in parts:
+                if batch and (lang != batch_lang or not max_chars
+                              or size + 2 + len(part) > max_chars):
+                    yield "\n\n".join(batch), batch_lang, heading
+                    batch, size = [], 0
+                batch.append(part)
+                batch_lang, size = lang, size + 2 * (len(batch) > 1) + len(part)
+                if cut_every and int(md5txt(part)[:8], 16) % cut_every == 0:
+                    yield "\n\n".join(batch), batch_lang, heading
+                    batch, size = [], 0
+    if batch:
+        yield "\n\n".join(batch), batch_lang, heading
+
+# ---------- движки синтеза ----------
+class TTSError(RuntimeError):
+    pass
+
+class EdgeTTSEngine:
+    """edge-tts: в процессе, если пакет установлен, иначе – async-подпроцесс CLI."""
+    name = "edge"
+
+    def __init__(self, rate="+0%", volume="+0%"):
+        self.rate, self.volume = rate, volume
+        try:
+            import edge_tts
+        except ImportError:
+            edge_tts = None
+        self._edge_tts = edge_tts
+
+    async def synth(self, text: str, voice: str, out: pathlib.Path):
+        if self._edge_tts is not None:
+            com = self._edge_tts.Communicate(text, voice, rate=self.rate, volume=self.volume)
+            await com.save(str(out))
+            return
+        proc = await asyncio.create_subprocess_exec(
+            "edge-tts", "--voice", voice, "--text", text, "--write-media", str(out),
+            "--rate", self.rate, "--volume", self.volume,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        )
+        _, err = await proc.communicate()
+        if proc.returncode:
+            raise TTSError(err.decode(errors="replace")[:120])
+
+# Тихий кадр MPEG-1 Layer III, 128 кбит/с, 44.1 кГц: 417 байт ≈ 26 мс
+SILENT_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+
+class LocalEngine:
+    """Офлайн-заглушка для тестов и бенчмарков: пишет тишину, длина ~ длине текста."""
+    name = "local"
+
+    def __init__(self, latency: float = 0.0, chars_per_sec: int = 15):
+        self.latency, self.chars_per_sec = latency, chars_per_sec
+
+    async def synth(self, text: str, voice: str, out: pathlib.Path):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        n_frames = max(1, round(len(text) / self.chars_per_sec / 0.026))
+        out.write_bytes(SILENT_FRAME * n_frames)
+
+ENGINES = {e.name: e for e in (EdgeTTSEngine, LocalEngine)}
 
 # ---------- синтез ----------
-def synth_one(args):
-    text, lang, idx = args
+async def synth_one(engine, text: str, lang: str, idx: int, sem: asyncio.Semaphore):
     h = md5txt(text)
     out = CACHE_DIR / f"{h}_{lang}.mp3"
     if out.exists():
         return idx, out
 
-    # 1. Убираем символы, которые ломают shell
+    # 1. Убираем символы, которые ломают движок
     text = re.sub(r"[`$<>|;&()\\]", " ", text).strip()
     if not text:                       # 2. на всякий случай
         return idx, None
 
-    voice = VOICES[lang]
-    cmd = [
-        "edge-tts",
-        "--voice", voice,
-        "--text", text,
-        "--write-media", str(out),
-        "--rate", "+0%",
-        "--volume", "+0%"
-    ]
-    try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        # 3. понятное сообщение, но не падаем весь пул
-        print(f"\n⚠️  edge-tts error on frag {idx}: {e.stderr[:120]}")
-        return idx, None
-    return idx, out
+    # 3. пишем во временный файл, чтобы оборванный синтез не попал в кеш
+    tmp = out.with_name(out.name + ".part")
+    async with sem:
+        for attempt in range(RETRIES):
+            try:
+                await engine.synth(text, VOICES[lang], tmp)
+                tmp.replace(out)
+                return idx, out
+            except Exception as e:
+                if attempt + 1 == RETRIES:
+                    # понятное сообщение, но не роняем весь конвейер
+                    tqdm.write(f"⚠️  {engine.name} error on frag {idx}: {str(e)[:120]}")
+                    tmp.unlink(missing_ok=True)
+                    return idx, None
+                await asyncio.sleep(BACKOFF * 2 ** attempt * (1 + random.random()))
+
+async def synth_all(jobs, engine, concurrency: int = N_CONCURRENT, progress=None):
+    """Синтезирует jobs = [(text, lang, idx)], возвращает пути в исходном порядке.
+
+    progress(idx, path) вызывается по мере готовности фрагментов."""
+    sem = asyncio.Semaphore(concurrency)
+    files_ordered = [None] * len(jobs)
+    # одинаковые фрагменты ("Еще пример") синтезируются одной задачей:
+    # иначе они пишут в один и тот же .part одновременно
+    shared = {}
+
+    async def job(text, lang, idx):
+        key = (md5txt(text), lang)
+        if key not in shared:
+            shared[key] = asyncio.ensure_future(synth_one(engine, text, lang, idx, sem))
+        _, path = await shared[key]
+        return idx, path
+
+    tasks = [asyncio.create_task(job(t, lang, i)) for t, lang, i in jobs]
+    for fut in asyncio.as_completed(tasks):
+        idx, mp3_path = await fut
+        files_ordered[idx] = mp3_path
+        if progress is not None:
+            progress(idx, mp3_path)
+    return files_ordered
 
 # ---------- склейка ----------
-def concat_mp3(files: list[pathlib.Path], out: pathlib.Path):
-    """Без перекодирования, за один проход ffmpeg."""
-    list_path = out.with_suffix(".txt")
-    with open(list_path, "w", encoding="utf-8") as f:
-        for fp in files:
-            f.write(f"file '{fp.resolve()}'\n")
-    subprocess.run(
-        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0",
-         "-i", str(list_path), "-c", "copy", "-y", str(out)], check=True
-    )
-    list_path.unlink()
+# битрейты, кбит/с: (MPEG1 | MPEG2/2.5, слой) -> таблица по индексу
+MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_BITRATES[2, 3] = MP3_BITRATES[2, 2]
+MP3_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def mp3_audio(data: bytes) -> tuple[memoryview, float]:
+    """Отрезает ID3-теги и мусор, возвращает (MPEG-кадры, длительность в мс)."""
+    start, end = 0, len(data)
+    if data[:3] == b"ID3":
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | data[9] & 0x7F
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    pos, ms, first = start, 0.0, None
+    while pos + 4 <= end:
+        b1, b2 = data[pos + 1], data[pos + 2]
+        version, layer = (b1 >> 3) & 3, 4 - ((b1 >> 1) & 3)
+        br_idx, sr_idx = b2 >> 4, (b2 >> 2) & 3
+        if (data[pos] != 0xFF or b1 & 0xE0 != 0xE0 or version == 1 or layer == 4
+                or br_idx in (0, 15) or sr_idx == 3):
+            if first is None:          # ищем первый кадр
+                pos += 1
+                continue
+            break                      # хвост без кадров
+        first = pos if first is None else first
+        bitrate = MP3_BITRATES[1 if version == 3 else 2, layer][br_idx] * 1000
+        rate = MP3_RATES[version][sr_idx]
+        pad = (b2 >> 1) & 1
+        if layer == 1:
+            samples, length = 384, (12 * bitrate // rate + pad) * 4
+        else:
+            samples = 576 if layer == 3 and version != 3 else 1152
+            length = samples // 8 * bitrate // rate + pad
+        if pos + length > end:
+            break
+        pos += length
+        ms += samples * 1000 / rate
+    if first is None:                  # ни одного кадра: HTML, текст ошибки и т.п.
+        return memoryview(b""), 0.0
+    return memoryview(data)[first:pos], ms
+
+def id3_chapters(chapters: list[tuple[str, int, int]]) -> bytes:
+    """ID3v2.3 с оглавлением (CTOC) и главами (CHAP): [(title, start_ms, end_ms)]."""
+    def frame(fid: bytes, body: bytes) -> bytes:
+        return fid + len(body).to_bytes(4, "big") + b"\0\0" + body
+
+    def title(text: str) -> bytes:
+        return frame(b"TIT2", b"\x01" + text.encode("utf-16") + b"\0\0")
+
+    body = frame(b"CTOC", b"toc\0" + b"\x03" + bytes([min(len(chapters), 255)])
+                 + b"".join(b"ch%d\0" % i for i in range(min(len(chapters), 255))))
+    for i, (name, start, end) in enumerate(chapters):
+        body += frame(b"CHAP", b"ch%d\0" % i + start.to_bytes(4, "big") + end.to_bytes(4, "big")
+                      + b"\xff" * 8 + title(name))
+    size = bytes((len(body) >> s) & 0x7F for s in (21, 14, 7, 0))   # syncsafe
+    return b"ID3\x03\x00\x00" + size + body
+
+class Mp3Assembler:
+    """Дописывает готовые фрагменты в out строго по порядку, по мере их прихода.
+
+    Склейка идёт параллельно синтезу: кадры копируются напрямую, без ffmpeg.
+    chapters – {индекс первого фрагмента: заголовок}, либо toc – готовое
+    оглавление [(title, start_ms, end_ms)]. Размер ID3-тега зависит только от
+    заголовков, поэтому тег пишется в начало с нулевыми временами и
+    перезаписывается на месте в close(); итоговое оглавление остаётся в self.toc."""
+
+    def __init__(self, out: pathlib.Path, chapters: dict[int, str] = None, toc=None):
+        self.out, self.chapters, self.toc = out, chapters or {}, toc
+        self.ms, self.fragments, self.failed = 0.0, 0, 0
+        self._tmp = out.with_name(out.name + ".part")
+        self._f = open(self._tmp, "wb")
+        titles = [t for t, *_ in toc] if toc is not None else self.chapters.values()
+        self._f.write(id3_chapters([(t, 0, 0) for t in titles]))
+        self._next, self._pending, self._starts = 0, {}, {}
+
+    def add(self, idx: int, path):
+        self._pending[idx] = path
+        while self._next in self._pending:
+            path = self._pending.pop(self._next)
+            if self._next in self.chapters:
+                self._starts[self._next] = round(self.ms)
+            if path is None:
+                self.failed += 1
+            else:
+                frames, ms = mp3_audio(path.read_bytes())
+                if frames:
+                    self._f.write(frames)
+                    self.ms += ms
+                    self.fragments += 1
+                else:
+                    # движок записал не MP3 – убираем из кеша, чтобы синтезировать снова
+                    self.failed += 1
+                    path.unlink(missing_ok=True)
+            self._next += 1
+
+    def close(self):
+        if self.toc is None:
+            total = round(self.ms)
+            starts = [self._starts.get(i, total) for i in self.chapters]
+            self.toc = list(zip(self.chapters.values(), starts, starts[1:] + [total]))
+        self._f.seek(0)
+        self._f.write(id3_chapters(self.toc))
+        self._f.close()
+        self._tmp.replace(self.out)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self._f.close()
+            self._tmp.unlink(missing_ok=True)
+
+# ---------- разделы ----------
+def split_sections(md: str):
+    """Делит документ по заголовкам '#' (вне блоков кода): [(title, text)]."""
+    sections, title, lines, in_code = [], None, [], False
+    for line in md.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        elif not in_code and line.startswith("# "):
+            if lines:
+                sections.append((title, "".join(lines)))
+            title, lines = line[2:].strip(), []
+        lines.append(line)
+    if lines:
+        sections.append((title, "".join(lines)))
+    return sections
+
+def write_playlist(path: pathlib.Path, entries):
+    lines = ["#EXTM3U"]
+    for e in entries:
+        lines += [f"#EXTINF:{round(e['ms'] / 1000)},{e['title'] or ''}", e["file"]]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
 
 # ---------- main ----------
-def md2speech(md_path: pathlib.Path, out_mp3: pathlib.Path):
-    md_text = md_path.read_text(encoding="utf-8")
-    paragraphs = list(split_md(md_text))
-    jobs = [(p, detect_lang(p), i) for i, p in enumerate(paragraphs)]
-
-    print(f"Синтез {len(jobs)} фрагментов, {N_WORKERS} workers…")
-    files_ordered = [None] * len(jobs)    
-    ok_count = 0
-    with ProcessPoolExecutor(N_WORKERS) as ex:
-        futures = {ex.submit(synth_one, j): j for j in jobs}
-        for f in tqdm(as_completed(futures), total=len(futures), unit="frag"):
-            idx, mp3_path = f.result()
-            if mp3_path is not None:            # <-- успешно
-                files_ordered[idx] = mp3_path
-                ok_count += 1
-
-    files_ordered = [f for f in files_ordered if f is not None]  # убираем None
-    if ok_count == 0:
+def md2speech(md_path: pathlib.Path, out_mp3: pathlib.Path, engine=None,
+              concurrency: int = N_CONCURRENT, batch_chars: int = BATCH_CHARS,
+              sections_dir: pathlib.Path = None, cut_every: int = BATCH_CUT_EVERY):
+    """Собирает по mp3 на каждый раздел '#' в sections_dir и склеивает их в out_mp3.
+
+    manifest.json помнит хеш исходника и хеш фрагментов каждого раздела:
+    неизменённые разделы не разбираются и не синтезируются заново,
+    а итоговый файл и playlist.m3u пересобираются простым копированием кадров.
+    Там же хранятся главы раздела ('#' и '##') со временем от его начала –
+    из них со сдвигами собирается оглавление out_mp3."""
+    engine = engine or EdgeTTSEngine()
+    sections_dir = sections_dir or out_mp3.with_suffix(".sections")
+    sections_dir.mkdir(exist_ok=True)
+    manifest_path = sections_dir / "manifest.json"
+    old = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest_path.exists() else []
+    old_by_src = {e["src"]: e for e in old if (sections_dir / e["file"]).exists()}
+    old_by_hash = {e["hash"]: e for e in old_by_src.values()}
+
+    entries, dirty = [], {}
+    for title, text in split_sections(md_path.read_text(encoding="utf-8")):
+        src = md5txt(text)
+        if src in old_by_src:                  # раздел не менялся вовсе
+            entries.append(dict(old_by_src[src], title=title))
+            continue
+        fragments = list(batch_fragments(split_md(text, headings=True), batch_chars, cut_every))
+        if not fragments:
+            continue
+        h = md5txt("\n".join(md5txt(t) + lang for t, lang, _ in fragments))
+        entry = {"title": title, "src": src, "hash": h, "file": f"{h}.mp3",
+                 "ms": None, "chapters": None}
+        if h in old_by_hash:                   # изменилось только то, что не читается
+            entry["ms"] = old_by_hash[h]["ms"]
+            entry["chapters"] = old_by_hash[h].get("chapters")
+        else:
+            dirty.setdefault(h, fragments)
+        entries.append(entry)
+
+    jobs, offsets, assemblers = [], [], []
+    for h, fragments in dirty.items():
+        offsets.append(len(jobs))
+        jobs += [(t, lang, len(jobs) + i) for i, (t, lang, _) in enumerate(fragments)]
+
+    print(f"Разделов: {len(entries)}, пересобрать: {len(dirty)}; "
+          f"синтез {len(jobs)} фрагментов, {engine.name}, до {concurrency} одновременно…")
+    with tqdm(total=len(jobs), unit="frag") as pbar, contextlib.ExitStack() as stack:
+        for h, fragments in dirty.items():
+            chapters = {i: hd for i, (_, _, hd) in enumerate(fragments)
+                        if hd is not None and (i == 0 or fragments[i - 1][2] != hd)}
+            assemblers.append(stack.enter_context(Mp3Assembler(sections_dir / f"{h}.mp3", chapters)))
+
+        def progress(idx, path):
+            pbar.update()
+            n = bisect.bisect_right(offsets, idx) - 1
+            assemblers[n].add(idx - offsets[n], path)
+        if jobs:
+            asyncio.run(synth_all(jobs, engine, concurrency, progress))
+
+    done = {}
+    for h, asm in zip(dirty, assemblers):
+        if asm.fragments and not asm.failed:
+            done[h] = {"ms": asm.ms, "chapters": [list(c) for c in asm.toc]}
+        else:                                  # с пропусками раздел не запоминаем
+            asm.out.unlink()
+    if failed := len(dirty) - len(done):
+        print(f"⚠️  Разделов с ошибками синтеза: {failed} – они пропущены, "
+              f"повторный запуск синтезирует только недостающее.")
+    for e in entries:
+        e.update(done.get(e["hash"], {}))
+    entries = [e for e in entries if e["ms"] is not None]
+    if not entries:
         sys.exit("Нет успешно синтезированных фрагментов – аудио не создано.")
-        
+
+    tmp = manifest_path.with_name(manifest_path.name + ".part")
+    tmp.write_text(json.dumps(entries, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(manifest_path)
+    write_playlist(sections_dir / "playlist.m3u", entries)
+    keep = {e["file"] for e in entries}
+    for stale in sections_dir.glob("*.mp3"):
+        if stale.name not in keep:
+            stale.unlink()
+
+    toc, offset = [], 0.0
+    for e in entries:                          # старый manifest – только заголовок '#'
+        chapters = e.get("chapters") or ([(e["title"], 0, e["ms"])] if e["title"] else [])
+        toc += [(t, round(offset + start), round(offset + end)) for t, start, end in chapters]
+        offset += e["ms"]
+
     print("Склейка…")
-    if not files_ordered:
-        sys.exit("Нечего склеивать.")
-    concat_mp3(files_ordered, out_mp3)
-    concat_mp3(files_ordered, out_mp3)
-    print("✅ Готово:", out_mp3.resolve())
+    with Mp3Assembler(out_mp3, toc=toc) as asm:
+        for i, e in enumerate(entries):
+            asm.add(i, sections_dir / e["file"])
+    print(f"✅ Готово: {out_mp3.resolve()} ({asm.ms / 60000:.1f} мин, {len(entries)} разделов)")
 
 if __name__ == "__main__":
-    import argparse, sys
+    import argparse
     ap = argparse.ArgumentParser()
     ap.add_argument("md", type=pathlib.Path)
     ap.add_argument("-o", "--out", type=pathlib.Path, default="speech.mp3")
+    ap.add_argument("-e", "--engine", choices=sorted(ENGINES), default="edge")
+    ap.add_argument("-j", "--jobs", type=int, default=N_CONCURRENT,
+                    help="сколько фрагментов синтезировать одновременно")
+    ap.add_argument("-b", "--batch-chars", type=int, default=BATCH_CHARS,
+                    help="максимум символов в пакете, 0 – каждый абзац отдельно")
+    ap.add_argument("--cut-every", type=int, default=BATCH_CUT_EVERY,
+                    help="средняя длина пакета в абзацах до среза по хешу, 0 – без срезов")
+    ap.add_argument("-s", "--sections-dir", type=pathlib.Path,
+                    help="куда класть mp3 разделов и manifest.json (по умолчанию <out>.sections)")
     args = ap.parse_args()
     if not args.md.exists():
         sys.exit("Файл не найден")
-    md2speech(args.md, args.out)
\ No newline at end of file
+    md2speech(args.md, args.out, ENGINES[args.engine](), args.jobs, args.batch_chars,
+              args.sections_dir, args.cut_every)
@@ -1,26 +1,242 @@
-import strawberry
+import hashlib
+import json
+import os
+from collections import OrderedDict, defaultdict
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI
+import strawberry
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import BaseModel
+from strawberry.dataloader import DataLoader
+from strawberry.extensions import MaxAliasesLimiter, MaxTokensLimiter, QueryDepthLimiter
 from strawberry.fastapi import GraphQLRouter
+from strawberry.types import Info
+
+# Те же коллекции, что и в backend/main.py
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+client = AsyncIOMotorClient(MONGODB_URL)
+db = client.interview_db
+categories_collection = db.categories
+questions_collection = db.questions
+
+# Ограничения сложности запроса
+MAX_DEPTH = int(os.getenv("GRAPHQL_MAX_DEPTH", 6))
+MAX_ALIASES = int(os.getenv("GRAPHQL_MAX_ALIASES", 15))
+MAX_TOKENS = int(os.getenv("GRAPHQL_MAX_TOKENS", 1000))
+MAX_PERSISTED_QUERIES = 1000
+
+
+def id_forms(ids: List[str]) -> List[Any]:
+    """Значения для $in по ссылке: backend/main.py пишет category_id строкой
+    (PyObjectId - подкласс str), а импортированные данные - ObjectId"""
+    return [form for i in ids for form in ((ObjectId(i), i) if ObjectId.is_valid(i) else (i,))]
+
+
+# ---------- DataLoader'ы: один запрос в Mongo на уровень вложенности ----------
+async def load_categories(ids: List[str]) -> List[Optional[dict]]:
+    docs = categories_collection.find({"_id": {"$in": id_forms(ids)}})
+    by_id = {str(doc["_id"]): doc async for doc in docs}
+    return [by_id.get(i) for i in ids]
+
+
+async def load_questions_by_category(
+    keys: List[Tuple[str, Optional[str], int]]
+) -> List[List[dict]]:
+    """keys - (category_id, difficulty, limit). Фильтр и limit считает Mongo:
+    $topN оставляет в каждой категории только первые limit вопросов,
+    по одному запросу на каждую встреченную пару (difficulty, limit)"""
+    groups = defaultdict(list)
+    for category_id, difficulty, limit in keys:
+        groups[difficulty, limit].append(category_id)
+    found = {}
+    for (difficulty, limit), category_ids in groups.items():
+        match = {"category_id": {"$in": id_forms(category_ids)}}
+        if difficulty is not None:
+            match["difficulty"] = difficulty
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {"$toString": "$category_id"},
+                "docs": {"$topN": {"n": limit, "sortBy": {"created_at": 1, "_id": 1},
+                                   "output": "$$ROOT"}},
+            }},
+        ]
+        async for group in questions_collection.aggregate(pipeline):
+            found[group["_id"], difficulty, limit] = group["docs"]
+    return [found.get(key, []) for key in keys]
+
+
+async def get_context() -> Dict[str, Any]:
+    # loader'ы создаются на каждый запрос, чтобы кеш не жил дольше запроса
+    return {
+        "category_loader": DataLoader(load_fn=load_categories),
+        "questions_loader": DataLoader(load_fn=load_questions_by_category),
+    }
+
+
+# ---------- схема ----------
+@strawberry.enum
+class Difficulty(Enum):
+    easy = "easy"
+    medium = "medium"
+    hard = "hard"
+
+
+@strawberry.type
+class Question:
+    id: strawberry.ID
+    question_text: str
+    answer_text: str
+    difficulty: Difficulty
+    tags: List[str]
+    category_id: strawberry.ID
+
+    @strawberry.field
+    async def category(self, info: Info) -> Optional["Category"]:
+        doc = await info.context["category_loader"].load(str(self.category_id))
+        return Category.from_doc(doc) if doc else None
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Question":
+        return cls(
+            id=str(doc["_id"]),
+            question_text=doc["question_text"],
+            answer_text=doc["answer_text"],
+            difficulty=Difficulty(doc["difficulty"]),
+            tags=doc.get("tags", []),
+            category_id=str(doc["category_id"]),
+        )
+
+
+@strawberry.type
+class Category:
+    id: strawberry.ID
+    name: str
+    description: Optional[str]
+
+    @strawberry.field
+    async def questions(
+        self,
+        info: Info,
+        difficulty: Optional[Difficulty] = None,
+        limit: int = 100,
+    ) -> List[Question]:
+        if limit <= 0:
+            return []
+        key = (str(self.id), difficulty.value if difficulty else None, min(limit, 100))
+        docs = await info.context["questions_loader"].load(key)
+        return [Question.from_doc(d) for d in docs]
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Category":
+        return cls(id=str(doc["_id"]), name=doc["name"], description=doc.get("description"))
 
 
 @strawberry.type
 class Query:
 
     @strawberry.field
-    def hello(self) -> str:
-        return "Hello World"
-    
+    async def categories(self, limit: int = 100, skip: int = 0) -> List[Category]:
+        cursor = categories_collection.find().skip(skip).limit(min(limit, 1000))
+        return [Category.from_doc(doc) async for doc in cursor]
+
     @strawberry.field
-    def user(self) -> str:
-        return "user"
+    async def category(self, info: Info, id: strawberry.ID) -> Optional[Category]:
+        doc = await info.context["category_loader"].load(str(id))
+        return Category.from_doc(doc) if doc else None
 
+    @strawberry.field
+    async def questions(
+        self,
+        category_id: Optional[strawberry.ID] = None,
+        difficulty: Optional[Difficulty] = None,
+        tag: Optional[str] = None,
+        limit: int = 10,
+        skip: int = 0,
+    ) -> List[Question]:
+        query = {}
+        if category_id:
+            query["category_id"] = {"$in": id_forms([category_id])}
+        if difficulty:
+            query["difficulty"] = difficulty.value
+        if tag:
+            query["tags"] = tag
+        cursor = questions_collection.find(query).skip(skip).limit(min(limit, 100))
+        return [Question.from_doc(doc) async for doc in cursor]
 
-schema = strawberry.Schema(Query)
+    @strawberry.field
+    async def quiz_session(
+        self,
+        category_id: Optional[strawberry.ID] = None,
+        difficulty: Optional[Difficulty] = None,
+        size: int = 10,
+    ) -> List[Question]:
+        """Случайный набор вопросов на одну сессию"""
+        match = {}
+        if category_id:
+            match["category_id"] = {"$in": id_forms([category_id])}
+        if difficulty:
+            match["difficulty"] = difficulty.value
+        pipeline = [{"$match": match}, {"$sample": {"size": min(size, 100)}}]
+        return [Question.from_doc(doc) async for doc in questions_collection.aggregate(pipeline)]
 
-graphql_app = GraphQLRouter(schema)
+
+schema = strawberry.Schema(
+    Query,
+    extensions=[
+        QueryDepthLimiter(max_depth=MAX_DEPTH),
+        MaxAliasesLimiter(max_alias_count=MAX_ALIASES),
+        MaxTokensLimiter(max_token_count=MAX_TOKENS),
+    ],
+)
+
+graphql_app = GraphQLRouter(schema, context_getter=get_context)
 
 app = FastAPI()
 app.include_router(graphql_app, prefix="/graphql")
 
-# uvicorn main:app --reload
\ No newline at end of file
+
+# ---------- persisted queries ----------
+# Клиент шлет sha256 текста запроса вместо самого запроса. Неизвестный хеш
+# регистрируется, если вместе с ним пришел текст запроса с тем же хешем;
+# PERSISTED_QUERIES может указывать на JSON {хеш: запрос} для предзагрузки.
+persisted_queries: "OrderedDict[str, str]" = OrderedDict()
+if os.getenv("PERSISTED_QUERIES"):
+    with open(os.environ["PERSISTED_QUERIES"], encoding="utf-8") as fp:
+        persisted_queries.update(json.load(fp))
+
+
+class PersistedQueryRequest(BaseModel):
+    sha256: str
+    query: Optional[str] = None
+    variables: Optional[Dict[str, Any]] = None
+    operation_name: Optional[str] = None
+
+
+@app.post("/graphql/persisted")
+async def persisted_query(body: PersistedQueryRequest):
+    query = persisted_queries.get(body.sha256)
+    if query is None:
+        if body.query is None:
+            raise HTTPException(status_code=404, detail="PersistedQueryNotFound")
+        if hashlib.sha256(body.query.encode()).hexdigest() != body.sha256:
+            raise HTTPException(status_code=400, detail="sha256 does not match query")
+        query = persisted_queries[body.sha256] = body.query
+        if len(persisted_queries) > MAX_PERSISTED_QUERIES:
+            persisted_queries.popitem(last=False)
+
+    result = await schema.execute(
+        query,
+        variable_values=body.variables,
+        operation_name=body.operation_name,
+        context_value=await get_context(),
+    )
+    response: Dict[str, Any] = {"data": result.data}
+    if result.errors:
+        response["errors"] = [err.formatted for err in result.errors]
+    return response
+
+# uvicorn main:app --reload
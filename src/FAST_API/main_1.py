@@ -1,10 +1,38 @@
+import hashlib
 from typing import Union
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
 
 app = FastAPI()
 print("start")
 
+# Cache-Control по префиксу пути; данных в БД нет, поэтому ETag - хеш тела ответа
+CACHE_CONTROL = {
+    "/items/": "public, max-age=60",
+    "/": "public, max-age=300",
+}
+
+
+@app.middleware("http")
+async def etag_middleware(request: Request, call_next):
+    response = await call_next(request)
+    if request.method != "GET" or response.status_code != 200:
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = 'W/"%s"' % hashlib.md5(body).hexdigest()
+    headers = {"ETag": etag}
+    prefix = next((p for p in CACHE_CONTROL if request.url.path.startswith(p)), None)
+    if prefix is not None:
+        headers["Cache-Control"] = CACHE_CONTROL[prefix]
+
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=response.headers.get("content-type"),
+                    headers=headers)
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
@@ -12,4 +40,4 @@ def read_root():
 
 @app.get("/items/{item_id}")
 def read_item(item_id: int, q: Union[str, None] = None):
-    return {"item_id": item_id, "q": q}
\ No newline at end of file
+    return {"item_id": item_id, "q": q}
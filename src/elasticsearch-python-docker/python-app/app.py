@@ -1,9 +1,13 @@
 from flask import Flask, request
 from elasticsearch import Elasticsearch
-import os
+import json
 from dotenv import load_dotenv
 from flask_restx import Api, Resource, fields
 
+from bulk import DEFAULT_CHUNK_SIZE, bulk_index, iter_ndjson
+import mappings
+from es_client import client_kwargs
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -14,10 +18,7 @@ api = Api(app, version='1.0', title='Elasticsearch API',
 ns = api.namespace('elastic', description='Elasticsearch operations')
 
 # Подключение к Elasticsearch
-es = Elasticsearch(
-    hosts=[f"http://{os.getenv('ELASTIC_HOST')}:{os.getenv('ELASTIC_PORT')}"],
-    basic_auth=(os.getenv('ELASTIC_USERNAME'), os.getenv('ELASTIC_PASSWORD'))
-)
+es = Elasticsearch(**client_kwargs())
 
 # Models for Swagger documentation
 index_model = api.model('Index', {
@@ -29,11 +30,6 @@ document_model = api.model('Document', {
     'document': fields.Raw(required=True, description='Document to be indexed')
 })
 
-search_model = api.model('Search', {
-    'index_name': fields.String(required=True, description='Name of the index'),
-    'query': fields.String(required=True, description='Search query')
-})
-
 @ns.route('/')
 class Index(Resource):
     def get(self):
@@ -52,9 +48,9 @@ class CreateIndex(Resource):
             return {"error": "index_name is required"}, 400
         
         try:
-            if not es.indices.exists(index=index_name):
-                es.indices.create(index=index_name)
-                return {"message": f"Index {index_name} created"}, 201
+            if mappings.create_index(es, index_name):
+                return {"message": f"Index {index_name} created",
+                        "index": mappings.versioned_name(index_name)}, 201
             return {"message": f"Index {index_name} already exists"}, 200
         except Exception as e:
             return {"error": str(e)}, 500
@@ -77,9 +73,46 @@ class AddDocument(Resource):
         except Exception as e:
             return {"error": str(e)}, 500
 
+@ns.route('/bulk')
+class Bulk(Resource):
+    @ns.doc(params={
+        'index_name': 'Name of the index',
+        'chunk_size': f'Documents per bulk request (default {DEFAULT_CHUNK_SIZE})',
+        'thread_count': 'Parallel bulk threads (default 1)',
+    })
+    def post(self):
+        """Bulk index NDJSON documents from the request body (one document per line)"""
+        index_name = request.args.get('index_name')
+        if not index_name:
+            return {"error": "index_name is required"}, 400
+
+        try:
+            chunk_size = int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE))
+            thread_count = int(request.args.get('thread_count', 1))
+        except ValueError:
+            return {"error": "chunk_size and thread_count must be integers"}, 400
+
+        try:
+            result = bulk_index(es, index_name, iter_ndjson(request.stream),
+                                chunk_size=chunk_size, thread_count=thread_count)
+        except ValueError as e:
+            return {"error": f"Invalid NDJSON: {e}"}, 400
+        except Exception as e:
+            return {"error": str(e)}, 500
+        return result, 207 if result['failed'] else 201
+
 @ns.route('/search')
 class Search(Resource):
-    @ns.expect(search_model)
+    @ns.doc(params={
+        'index_name': 'Name of the index',
+        'query': 'Search query',
+        'size': 'Page size (default 10)',
+        'difficulty': 'Filter by difficulty',
+        'tag': 'Filter by tag',
+        'paginate': 'true to open a point in time for the following pages',
+        'pit_id': 'pit_id from the previous page',
+        'search_after': 'search_after from the previous page (JSON array)',
+    })
     def get(self):
         """Search in index"""
         index_name = request.args.get('index_name')
@@ -89,17 +122,22 @@ class Search(Resource):
             return {"error": "index_name and query are required"}, 400
         
         try:
-            res = es.search(
-                index=index_name,
-                body={
-                    "query": {
-                        "match": {
-                            "content": query
-                        }
-                    }
-                }
+            size = int(request.args.get('size', 10))
+            search_after = request.args.get('search_after')
+            search_after = json.loads(search_after) if search_after else None
+        except ValueError:
+            return {"error": "size must be an integer and search_after a JSON array"}, 400
+
+        try:
+            res = mappings.search(
+                es, index_name, query, size=size,
+                difficulty=request.args.get('difficulty'),
+                tag=request.args.get('tag'),
+                paginate=request.args.get('paginate', '').lower() in ('1', 'true'),
+                pit_id=request.args.get('pit_id'),
+                search_after=search_after,
             )
-            return res['hits']['hits'], 200
+            return res, 200
         except Exception as e:
             return {"error": str(e)}, 500
 
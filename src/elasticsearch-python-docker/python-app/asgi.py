@@ -0,0 +1,83 @@
+"""ASGI version of the search service on AsyncElasticsearch.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:8000
+
+Each worker keeps one AsyncElasticsearch client with a connection pool
+(see es_client.py). First-page searches are cached for SEARCH_CACHE_TTL
+seconds, so bursts of the same query hit Elasticsearch once; a request with
+"Cache-Control: no-cache" skips the cache.
+"""
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+from elasticsearch import AsyncElasticsearch
+from fastapi import FastAPI, Header, HTTPException, Query
+
+import mappings
+from cache import TTLCache
+from es_client import client_kwargs
+
+load_dotenv()
+
+search_cache = TTLCache(ttl=float(os.getenv('SEARCH_CACHE_TTL', 5)),
+                        maxsize=int(os.getenv('SEARCH_CACHE_SIZE', 1024)))
+es: Optional[AsyncElasticsearch] = None
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    global es
+    es = AsyncElasticsearch(**client_kwargs())
+    yield
+    await es.close()
+
+
+app = FastAPI(title='Elasticsearch API (ASGI)', lifespan=lifespan)
+
+
+@app.get('/elastic/')
+async def index():
+    return {"message": "Elasticsearch Python Docker Demo"}
+
+
+@app.get('/elastic/search')
+async def search(
+    index_name: str,
+    query: str,
+    size: int = Query(10, ge=1, le=100),
+    difficulty: Optional[str] = None,
+    tag: Optional[str] = None,
+    paginate: bool = Query(False, description="open a point in time for the following pages"),
+    pit_id: Optional[str] = None,
+    search_after: Optional[str] = Query(None, description="JSON array from the previous page"),
+    cache_control: Optional[str] = Header(None),
+):
+    try:
+        search_after = json.loads(search_after) if search_after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="search_after must be a JSON array")
+
+    # only plain first pages are cached: a point in time belongs to one client
+    cacheable = not paginate and pit_id is None and search_after is None
+    use_cached = cacheable and "no-cache" not in (cache_control or "").lower()
+    if cacheable:
+        key = TTLCache.make_key(index_name=index_name, query=query, size=size,
+                                difficulty=difficulty, tag=tag)
+        cached = search_cache.get(key) if use_cached else None
+        if cached is not None:
+            return cached
+
+    try:
+        res = await mappings.async_search(es, index_name, query, size=size,
+                                          difficulty=difficulty, tag=tag, paginate=paginate,
+                                          pit_id=pit_id, search_after=search_after)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if cacheable:
+        search_cache.set(key, res)
+    return res
@@ -0,0 +1,75 @@
+"""Concurrent search throughput: Flask (app.py) vs ASGI (asgi.py).
+
+    python bench_search.py questions "декоратор" "генератор" "GIL" \
+        --target flask=http://localhost:5000 --target asgi=http://localhost:8000
+
+Requests cycle through the given queries. The ASGI service caches first pages
+for a few seconds, so a single repeated query mostly measures that cache; pass
+several queries or --no-cache (sends Cache-Control: no-cache) to measure
+Elasticsearch round trips. Failed requests are counted as errors.
+
+Uses only the standard library, so it can run from the host or the container.
+"""
+import argparse
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url, headers):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers),
+                                    timeout=30) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except (urllib.error.URLError, TimeoutError):  # HTTPError is a URLError
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def run(base_url, params, queries, requests, concurrency, no_cache=False):
+    urls = [f"{base_url}/elastic/search?{urllib.parse.urlencode(dict(params, query=q))}"
+            for q in queries]
+    headers = {"Cache-Control": "no-cache"} if no_cache else {}
+    for url in urls:
+        fetch(url, headers)  # warm-up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda i: fetch(urls[i % len(urls)], headers), range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for _, latency in results)
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": sum(not ok for ok, _ in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("index_name")
+    parser.add_argument("queries", nargs="+", metavar="query")
+    parser.add_argument("--target", action="append", required=True,
+                        help="name=base_url, may be repeated")
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--concurrency", type=int, default=64)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ask the service to bypass its response cache")
+    args = parser.parse_args()
+
+    params = {"index_name": args.index_name}
+    print(f"{'target':<10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    for target in args.target:
+        name, base_url = target.split("=", 1)
+        r = run(base_url.rstrip("/"), params, args.queries, args.requests, args.concurrency,
+                args.no_cache)
+        print(f"{name:<10} {r['rps']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Bulk loading of documents into Elasticsearch.
+
+Used by the /elastic/bulk endpoint in app.py and by the bulk_load.py CLI.
+The client is passed in explicitly, so both can be pointed at a local
+container or at a fake client in tests.
+"""
+import json
+
+from elasticsearch import helpers
+
+from mappings import create_index
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+# Documents without _id get a new one on every attempt, so a _bulk chunk that
+# timed out must not be resent: it may already be indexed.
+BULK_TIMEOUT = 120
+
+
+def iter_ndjson(lines):
+    """Yield one document per non-empty NDJSON line (str or bytes)."""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_actions(index_name, documents):
+    """Turn documents into bulk actions; an optional "_id" key becomes the document id."""
+    for document in documents:
+        action = {"_index": index_name, "_source": document}
+        if "_id" in document:
+            action["_id"] = document.pop("_id")
+        yield action
+
+
+def bulk_index(es, index_name, documents, chunk_size=DEFAULT_CHUNK_SIZE, thread_count=1):
+    """Stream documents into index_name and return a summary of the load.
+
+    Refresh is switched off for the duration of the load and restored
+    (followed by a single refresh) afterwards. Documents that fail are
+    counted and the first MAX_REPORTED_ERRORS of them are reported instead
+    of aborting the whole load.
+    """
+    es = es.options(request_timeout=BULK_TIMEOUT, retry_on_timeout=False)
+    create_index(es, index_name)
+    settings = es.indices.get_settings(index=index_name, name="index.refresh_interval")
+    # index_name may be an alias, the response is keyed by the concrete index
+    refresh_interval = next(iter(settings.values()))["settings"].get("index", {}).get(
+        "refresh_interval")
+    es.indices.put_settings(index=index_name, settings={"index": {"refresh_interval": "-1"}})
+
+    actions = iter_actions(index_name, documents)
+    if thread_count > 1:
+        results = helpers.parallel_bulk(es, actions, thread_count=thread_count,
+                                        chunk_size=chunk_size, raise_on_error=False,
+                                        raise_on_exception=False)
+    else:
+        results = helpers.streaming_bulk(es, actions, chunk_size=chunk_size,
+                                         raise_on_error=False, raise_on_exception=False)
+
+    indexed, failed, errors = 0, 0, []
+    try:
+        for ok, item in results:
+            if ok:
+                indexed += 1
+                continue
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(item)
+    finally:
+        es.indices.put_settings(index=index_name,
+                                settings={"index": {"refresh_interval": refresh_interval}})
+        es.indices.refresh(index=index_name)
+
+    return {"indexed": indexed, "failed": failed, "errors": errors}
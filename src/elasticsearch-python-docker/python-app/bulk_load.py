@@ -0,0 +1,61 @@
+"""Load NDJSON or a Markdown question bank into Elasticsearch.
+
+    python bulk_load.py questions questions.jsonl
+    python bulk_load.py questions ../../../PYTHON_BASE.md --threads 4
+
+Markdown banks are parsed with iter_qa_pairs from the repository's add.py.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch
+
+from bulk import DEFAULT_CHUNK_SIZE, bulk_index, iter_ndjson
+from es_client import client_kwargs
+
+
+def iter_markdown(path):
+    sys.path.append(str(Path(__file__).resolve().parents[3]))
+    try:
+        from add import iter_qa_pairs
+    except ImportError:
+        sys.exit("Markdown banks need add.py from the repository root; "
+                 "convert the bank with 'python add.py convert bank.md bank.jsonl' instead")
+    with open(path, encoding="utf-8") as md_file:
+        for question, answer in iter_qa_pairs(md_file):
+            yield {"question": question, "content": answer}
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bulk load documents into Elasticsearch")
+    parser.add_argument("index_name")
+    parser.add_argument("source", help=".md bank or NDJSON file, '-' for NDJSON on stdin")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--threads", type=int, default=1,
+                        help="more than 1 switches to parallel_bulk")
+    parser.add_argument("--url", help="defaults to ELASTIC_HOST/ELASTIC_PORT")
+    args = parser.parse_args()
+
+    options = client_kwargs()
+    if args.url:
+        options["hosts"] = [args.url]
+    es = Elasticsearch(**options)
+    if args.source == "-":
+        documents = iter_ndjson(sys.stdin)
+    elif args.source.endswith(".md"):
+        documents = iter_markdown(args.source)
+    else:
+        documents = iter_ndjson(open(args.source, encoding="utf-8"))
+
+    result = bulk_index(es, args.index_name, documents,
+                        chunk_size=args.chunk_size, thread_count=args.threads)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if result["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
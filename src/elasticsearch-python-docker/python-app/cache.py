@@ -0,0 +1,36 @@
+"""Small in-process TTL cache for repeated search requests."""
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Keeps up to maxsize entries for ttl seconds, evicting the oldest first."""
+
+    def __init__(self, ttl=5.0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    @staticmethod
+    def make_key(**params):
+        """Normalised key: parameter order and surrounding whitespace/case of strings don't matter."""
+        return tuple(sorted(
+            (name, value.strip().lower() if isinstance(value, str) else value)
+            for name, value in params.items()
+        ))
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
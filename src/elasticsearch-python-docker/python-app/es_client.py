@@ -0,0 +1,22 @@
+"""Elasticsearch client settings shared by the Flask app, the ASGI app and the CLI."""
+import os
+
+
+def client_kwargs():
+    """Connection settings for Elasticsearch/AsyncElasticsearch, tunable through the environment.
+
+    ELASTIC_POOL_SIZE  - connections kept open per node (default 25)
+    ELASTIC_TIMEOUT    - request timeout in seconds (default 5)
+    ELASTIC_RETRIES    - retries on connection errors and timeouts (default 2)
+
+    Retrying on timeout is only safe for reads; bulk.bulk_index overrides both
+    the timeout and the retry for its writes.
+    """
+    return dict(
+        hosts=[f"http://{os.getenv('ELASTIC_HOST', 'localhost')}:{os.getenv('ELASTIC_PORT', '9200')}"],
+        basic_auth=(os.getenv('ELASTIC_USERNAME', 'elastic'), os.getenv('ELASTIC_PASSWORD')),
+        connections_per_node=int(os.getenv('ELASTIC_POOL_SIZE', 25)),
+        request_timeout=float(os.getenv('ELASTIC_TIMEOUT', 5)),
+        max_retries=int(os.getenv('ELASTIC_RETRIES', 2)),
+        retry_on_timeout=True,
+    )
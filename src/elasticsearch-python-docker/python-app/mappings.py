@@ -0,0 +1,172 @@
+"""Versioned index mapping and search template for the questions index.
+
+Indexes are created as "<alias>_v<MAPPING_VERSION>" behind an alias, so a
+new mapping version can be built next to the old one and switched over by
+moving the alias.
+"""
+import json
+
+MAPPING_VERSION = 1
+SEARCH_TEMPLATE_ID = f"questions-search-v{MAPPING_VERSION}"
+PIT_KEEP_ALIVE = "1m"
+SOURCE_FIELDS = ["question", "tags", "difficulty", "category"]
+
+_TEXT_FIELD = {
+    "type": "text",
+    "analyzer": "russian",
+    "fields": {
+        "en": {"type": "text", "analyzer": "english"},
+        "prefix": {"type": "text", "analyzer": "autocomplete", "search_analyzer": "standard"},
+    },
+}
+
+INDEX_SETTINGS = {
+    "analysis": {
+        "filter": {
+            "autocomplete_filter": {"type": "edge_ngram", "min_gram": 2, "max_gram": 20},
+        },
+        "analyzer": {
+            "autocomplete": {
+                "type": "custom",
+                "tokenizer": "standard",
+                "filter": ["lowercase", "autocomplete_filter"],
+            },
+        },
+    },
+}
+
+INDEX_MAPPINGS = {
+    "_meta": {"mapping_version": MAPPING_VERSION},
+    "properties": {
+        "question": _TEXT_FIELD,
+        "content": _TEXT_FIELD,
+        "tags": {"type": "keyword"},
+        "difficulty": {"type": "keyword"},
+        "category": {"type": "keyword"},
+    },
+}
+
+# Mustache template; ES escapes {{query}} etc. as JSON strings. The trailing
+# match_all keeps the filter list valid whichever optional filters are set.
+SEARCH_TEMPLATE = """{
+  {{#pit_id}}"pit": {"id": "{{pit_id}}", "keep_alive": "%(keep_alive)s"},{{/pit_id}}
+  "size": {{size}},
+  "_source": %(source)s,
+  "query": {
+    "bool": {
+      "must": {
+        "multi_match": {
+          "query": "{{query}}",
+          "type": "most_fields",
+          "fields": ["question^3", "question.en^2", "question.prefix",
+                     "content", "content.en", "content.prefix^0.5"]
+        }
+      },
+      "filter": [
+        {{#difficulty}}{"term": {"difficulty": "{{difficulty}}"}},{{/difficulty}}
+        {{#tag}}{"term": {"tags": "{{tag}}"}},{{/tag}}
+        {"match_all": {}}
+      ]
+    }
+  },
+  "highlight": {
+    "fields": {
+      "question": {"number_of_fragments": 0},
+      "content": {"fragment_size": 150, "number_of_fragments": 3}
+    }
+  },
+  "sort": [{"_score": "desc"}{{#pit_id}}, {"_shard_doc": "asc"}{{/pit_id}}]
+  {{#has_search_after}}, "search_after": {{#toJson}}search_after{{/toJson}}{{/has_search_after}}
+}""" % {"keep_alive": PIT_KEEP_ALIVE, "source": json.dumps(SOURCE_FIELDS)}
+
+_templates_ready = set()
+
+
+def versioned_name(alias):
+    return f"{alias}_v{MAPPING_VERSION}"
+
+
+def create_index(es, alias):
+    """Create the versioned index behind alias. Returns False if alias or index already exists."""
+    if es.indices.exists(index=alias):
+        return False
+    es.indices.create(index=versioned_name(alias), settings=INDEX_SETTINGS,
+                      mappings=INDEX_MAPPINGS, aliases={alias: {}})
+    return True
+
+
+def ensure_search_template(es):
+    if id(es) not in _templates_ready:
+        es.put_script(id=SEARCH_TEMPLATE_ID,
+                      script={"lang": "mustache", "source": SEARCH_TEMPLATE})
+        _templates_ready.add(id(es))
+
+
+def _template_params(pit_id, query, size, difficulty, tag, search_after):
+    return {
+        "pit_id": pit_id,
+        "size": size,
+        "query": query,
+        "difficulty": difficulty,
+        "tag": tag,
+        "has_search_after": search_after is not None,
+        "search_after": search_after,
+    }
+
+
+def _search_kwargs(alias, pit_id, query, size, difficulty, tag, search_after):
+    # a search with a point in time must not name the index
+    kwargs = {} if pit_id else {"index": alias}
+    return dict(kwargs, id=SEARCH_TEMPLATE_ID, params=_template_params(
+        pit_id, query, size, difficulty, tag, search_after))
+
+
+def _page(res, pit_id, size):
+    hits = res["hits"]["hits"]
+    pit_id = res.get("pit_id", pit_id)
+    return {
+        "total": res["hits"]["total"]["value"],
+        "hits": [{"_id": hit["_id"], "_score": hit["_score"], "_source": hit["_source"],
+                  "highlight": hit.get("highlight", {})} for hit in hits],
+        "pit_id": pit_id,
+        "search_after": hits[-1]["sort"] if pit_id and len(hits) == size else None,
+    }
+
+
+def search(es, alias, query, size=10, difficulty=None, tag=None, paginate=False,
+           pit_id=None, search_after=None):
+    """One page of results.
+
+    With paginate=True the first page opens a point in time; pass the returned
+    pit_id and search_after back to get the next page. The point in time is
+    closed when the last page is returned (search_after is None); a client that
+    stops earlier leaves it to expire after PIT_KEEP_ALIVE.
+    """
+    ensure_search_template(es)
+    if pit_id is None and paginate:
+        pit_id = es.open_point_in_time(index=alias, keep_alive=PIT_KEEP_ALIVE)["id"]
+    res = es.search_template(**_search_kwargs(alias, pit_id, query, size, difficulty, tag,
+                                              search_after))
+    page = _page(res, pit_id, size)
+    if page["pit_id"] and page["search_after"] is None:
+        es.close_point_in_time(id=page["pit_id"])
+        page["pit_id"] = None
+    return page
+
+
+async def async_search(es, alias, query, size=10, difficulty=None, tag=None, paginate=False,
+                       pit_id=None, search_after=None):
+    """search() for AsyncElasticsearch."""
+    if id(es) not in _templates_ready:
+        await es.put_script(id=SEARCH_TEMPLATE_ID,
+                            script={"lang": "mustache", "source": SEARCH_TEMPLATE})
+        _templates_ready.add(id(es))
+    if pit_id is None and paginate:
+        pit_id = (await es.open_point_in_time(index=alias, keep_alive=PIT_KEEP_ALIVE))["id"]
+    res = await es.search_template(**_search_kwargs(alias, pit_id, query, size, difficulty, tag,
+                                                    search_after))
+    page = _page(res, pit_id, size)
+    if page["pit_id"] and page["search_after"] is None:
+        await es.close_point_in_time(id=page["pit_id"])
+        page["pit_id"] = None
+    return page
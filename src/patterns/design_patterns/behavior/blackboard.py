@@ -20,7 +20,10 @@ https://en.wikipedia.org/wiki/Blackboard_system
 """
 
 import abc
+import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 
 class Blackboard(object):
@@ -37,6 +40,21 @@ class Blackboard(object):
     def add_expert(self, expert):
         self.experts.append(expert)
 
+    def merge(self, deltas):
+        """Складывает вклады экспертов в общее состояние.
+
+        Вклад - словарь приращений; числа складываются, списки дописываются,
+        поэтому итог не зависит от того, какой эксперт закончил первым, если
+        вклады переданы в порядке экспертов. Возвращает множество
+        изменившихся ключей."""
+        changed = set()
+        for delta in deltas:
+            for key, value in delta.items():
+                if value:
+                    self.common_state[key] = self.common_state[key] + value
+                    changed.add(key)
+        return changed
+
 
 class Controller(object):
 
@@ -51,59 +69,187 @@ class Controller(object):
         return self.blackboard.common_state['contributions']
 
 
+def _propose(expert, state, seed):
+    return expert.propose(state, random.Random(seed))
+
+
+class ConcurrentController(object):
+    """
+    Контроллер, опрашивающий экспертов параллельно.
+
+    Работа идет раундами: все готовые эксперты считают вклад по одному и тому
+    же состоянию в пуле потоков или процессов, затем вклады сливаются через
+    Blackboard.merge. Эксперт с заданным watches проверяется на готовность,
+    только если в прошлом раунде изменился один из его ключей - вместо
+    постоянного опроса. При заданном seed каждый эксперт в каждом раунде
+    получает свой генератор random.Random(seed, раунд, номер эксперта), и
+    результат воспроизводим при любом числе процессов. Эксперт получает не
+    common_state, а копию только тех ключей, что перечислены в его reads, -
+    растущая история contributions не пересылается в процессы каждый раунд.
+    """
+    EXECUTORS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+
+    def __init__(self, blackboard, executor='thread', max_workers=None, seed=None,
+                 max_idle_rounds=100):
+        self.blackboard = blackboard
+        self.executor = self.EXECUTORS[executor]
+        self.max_workers = max_workers
+        self.seed = seed
+        self.max_idle_rounds = max_idle_rounds
+
+    @staticmethod
+    def _snapshot(expert, state):
+        keys = expert.reads
+        if keys is None:
+            keys = [key for key in state if key != 'contributions']
+        return {key: state[key] for key in keys}
+
+    def _seed(self, round_no, index):
+        if self.seed is None:
+            return None
+        return '%s:%d:%d' % (self.seed, round_no, index)
+
+    def run_loop(self):
+        state = self.blackboard.common_state
+        if self.seed is not None:
+            random.seed(self.seed)  # для is_eager_to_contribute со случайностью
+        changed, round_no, idle = None, 0, 0
+        with self.executor(self.max_workers) as pool:
+            while state['progress'] < 100:
+                eager = [(i, expert) for i, expert in enumerate(self.blackboard.experts)
+                         if (changed is None or expert.watches is None
+                             or changed.intersection(expert.watches))
+                         and expert.is_eager_to_contribute]
+                futures = [pool.submit(_propose, expert, self._snapshot(expert, state),
+                                       self._seed(round_no, i))
+                           for i, expert in eager]
+                # результаты берутся в порядке экспертов, а не завершения
+                changed = self.blackboard.merge([f.result() for f in futures])
+                idle = 0 if changed else idle + 1
+                if idle > self.max_idle_rounds:
+                    raise RuntimeError('Ни один эксперт не готов внести вклад')
+                round_no += 1
+        return state['contributions']
+
+
 class AbstractExpert(object):
 
     __metaclass__ = abc.ABCMeta
 
+    # ключи common_state, от которых зависит is_eager_to_contribute;
+    # None - готовность надо проверять каждый раунд
+    watches = None
+    # ключи common_state, которые читает propose; None - все, кроме contributions
+    reads = None
+
     def __init__(self, blackboard):
         self.blackboard = blackboard
 
+    def __getstate__(self):
+        # в процесс пула эксперт уходит без доски: propose получает состояние аргументом
+        state = self.__dict__.copy()
+        state['blackboard'] = None
+        return state
+
     @abc.abstractproperty
     def is_eager_to_contribute(self):
         raise NotImplementedError('Must provide implementation in subclass.')
 
     @abc.abstractmethod
-    def contribute(self):
+    def propose(self, state, rng):
+        """Возвращает вклад - словарь приращений common_state"""
         raise NotImplementedError('Must provide implementation in subclass.')
 
+    def contribute(self):
+        self.blackboard.merge([self.propose(self.blackboard.common_state, random)])
+
 
 class Student(AbstractExpert):
 
+    reads = ()
+
     @property
     def is_eager_to_contribute(self):
         return True
 
-    def contribute(self):
-        self.blackboard.common_state['problems'] += random.randint(1, 10)
-        self.blackboard.common_state['suggestions'] += random.randint(1, 10)
-        self.blackboard.common_state['contributions'] += [self.__class__.__name__]
-        self.blackboard.common_state['progress'] += random.randint(1, 2)
+    def propose(self, state, rng):
+        return {
+            'problems': rng.randint(1, 10),
+            'suggestions': rng.randint(1, 10),
+            'contributions': [self.__class__.__name__],
+            'progress': rng.randint(1, 2),
+        }
 
 
 class Scientist(AbstractExpert):
 
+    reads = ()
+
     @property
     def is_eager_to_contribute(self):
         return random.randint(0, 1)
 
-    def contribute(self):
-        self.blackboard.common_state['problems'] += random.randint(10, 20)
-        self.blackboard.common_state['suggestions'] += random.randint(10, 20)
-        self.blackboard.common_state['contributions'] += [self.__class__.__name__]
-        self.blackboard.common_state['progress'] += random.randint(10, 30)
+    def propose(self, state, rng):
+        return {
+            'problems': rng.randint(10, 20),
+            'suggestions': rng.randint(10, 20),
+            'contributions': [self.__class__.__name__],
+            'progress': rng.randint(10, 30),
+        }
 
 
 class Professor(AbstractExpert):
 
+    watches = ('problems',)
+    reads = ()
+
     @property
     def is_eager_to_contribute(self):
         return True if self.blackboard.common_state['problems'] > 100 else False
 
-    def contribute(self):
-        self.blackboard.common_state['problems'] += random.randint(1, 2)
-        self.blackboard.common_state['suggestions'] += random.randint(10, 20)
-        self.blackboard.common_state['contributions'] += [self.__class__.__name__]
-        self.blackboard.common_state['progress'] += random.randint(10, 100)
+    def propose(self, state, rng):
+        return {
+            'problems': rng.randint(1, 2),
+            'suggestions': rng.randint(10, 20),
+            'contributions': [self.__class__.__name__],
+            'progress': rng.randint(10, 100),
+        }
+
+
+class Researcher(AbstractExpert):
+    """Дорогой эксперт для замера масштабирования"""
+
+    work = 300000
+    reads = ()
+
+    @property
+    def is_eager_to_contribute(self):
+        return True
+
+    def propose(self, state, rng):
+        offset = rng.randint(0, 10)
+        checksum = sum((i + offset) * (i + offset) % 7 for i in range(self.work))
+        return {
+            'suggestions': checksum % 10,
+            'contributions': [self.__class__.__name__],
+            'progress': 1,
+        }
+
+
+def benchmark(experts=os.cpu_count() or 4, seed=42):
+    results = {}
+    for name, executor, workers in (('1 поток', 'thread', 1),
+                                    ('потоки', 'thread', experts),
+                                    ('процессы', 'process', experts)):
+        blackboard = Blackboard()
+        for _ in range(experts):
+            blackboard.add_expert(Researcher(blackboard))
+        started = time.perf_counter()
+        ConcurrentController(blackboard, executor, workers, seed=seed).run_loop()
+        print('%-10s %.2f с' % (name, time.perf_counter() - started))
+        results[name] = blackboard.common_state
+    # с одинаковым seed итог не зависит от способа выполнения
+    assert len({repr(sorted(r.items())) for r in results.values()}) == 1
 
 
 if __name__ == '__main__':
@@ -119,6 +265,13 @@ if __name__ == '__main__':
     from pprint import pprint
     pprint(contributions)
 
+    blackboard = Blackboard()
+    for expert_cls in (Student, Scientist, Professor):
+        blackboard.add_expert(expert_cls(blackboard))
+    pprint(ConcurrentController(blackboard, 'process', seed=1).run_loop())
+
+    benchmark()
+
 ### OUTPUT ###
 # ['Student',
 #  'Student',
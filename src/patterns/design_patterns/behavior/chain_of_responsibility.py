@@ -8,15 +8,28 @@
 и передает запрос вдоль этой цепочки, пока его не обработают.
 """
 
+import bisect
+import time
+from itertools import chain
+
 
 class HttpHandler(object):
-    """Абстрактный класс обработчика"""
+    """Абстрактный класс обработчика.
+
+    keys - коды, которые обработчик может обработать, ranges - пары
+    (от, до) включительно. Если не задано ни то, ни другое, обработчик
+    считается предикатом и вызывается для любого кода."""
+    keys = None
+    ranges = None
+
     def handle(self, code):
         raise NotImplementedError()
 
 
 class Http404Handler(HttpHandler):
     """Обработчик для кода 404"""
+    keys = (404,)
+
     def handle(self, code):
         if code == 404:
             return 'Страница не найдена'
@@ -24,31 +37,125 @@ class Http404Handler(HttpHandler):
 
 class Http500Handler(HttpHandler):
     """Обработчик для кода 500"""
+    keys = (500,)
+
     def handle(self, code):
         if code == 500:
             return 'Ошибка сервера'
 
 
+class Http5xxHandler(HttpHandler):
+    """Обработчик для остальных ошибок сервера"""
+    ranges = ((500, 599),)
+
+    def handle(self, code):
+        return 'Ошибка сервера (%d)' % code
+
+
 class Client(object):
+    """
+    Цепочка обработчиков.
+
+    Перед первым запросом цепочка компилируется в таблицу: для каждого кода
+    из keys и для каждого отрезка между границами ranges заранее известен
+    список обработчиков, которые могут его обработать, в порядке добавления
+    (предикаты входят в каждый список). Поиск - словарь или bisect по
+    отрезкам, а дальше обработчики вызываются по порядку, как и раньше:
+    отвечает первый, вернувший непустой ответ.
+    """
     def __init__(self):
         self._handlers = []
+        self._table = None
 
     def add_handler(self, h):
         self._handlers.append(h)
+        self._table = None
 
-    def response(self, code):
-        for h in self._handlers:
+    def _compile(self):
+        predicates = [(i, h) for i, h in enumerate(self._handlers)
+                      if h.keys is None and h.ranges is None]
+        ranged = [(lo, hi, i, h) for i, h in enumerate(self._handlers)
+                  for lo, hi in (h.ranges or ())]
+
+        def candidates(code, extra=()):
+            found = set(extra)
+            found.update((i, h) for lo, hi, i, h in ranged if lo <= code <= hi)
+            found.update(predicates)
+            return tuple(h for _, h in sorted(found, key=lambda item: item[0]))
+
+        by_key = {}
+        for i, h in enumerate(self._handlers):
+            for key in h.keys or ():
+                by_key.setdefault(key, set()).add((i, h))
+        keyed = {key: candidates(key, found) for key, found in by_key.items()}
+
+        # элементарные отрезки: внутри каждого набор подходящих ranges один и тот же
+        bounds = sorted(set(chain.from_iterable((lo, hi + 1) for lo, hi, _, _ in ranged)))
+        segments = [candidates(lo) for lo in bounds]
+        fallback = tuple(h for _, h in predicates)
+        self._table = keyed, bounds, segments, fallback
+
+    def candidates(self, code):
+        if self._table is None:
+            self._compile()
+        keyed, bounds, segments, fallback = self._table
+        found = keyed.get(code)
+        if found is not None:
+            return found
+        pos = bisect.bisect_right(bounds, code) - 1 if isinstance(code, int) else -1
+        return segments[pos] if pos >= 0 else fallback
+
+    def dispatch(self, code):
+        for h in self.candidates(code):
             msg = h.handle(code)
             if msg:
-                print 'Ответ: %s' % msg
-                break
+                return msg
+        return None
+
+    def response(self, code):
+        msg = self.dispatch(code)
+        if msg:
+            print('Ответ: %s' % msg)
         else:
-            print 'Код не обработан'
+            print('Код не обработан')
+
+
+class StatusHandler(HttpHandler):
+    def __init__(self, code):
+        self.keys = (code,)
+
+    def handle(self, code):
+        return 'status %d' % code
+
+
+def benchmark(n_handlers=1000, requests=200000):
+    client = Client()
+    for code in range(n_handlers):
+        client.add_handler(StatusHandler(code))
+    codes = [i * 7919 % n_handlers for i in range(requests)]
+
+    def linear(code):
+        for h in client._handlers:
+            msg = h.handle(code) if code in h.keys else None
+            if msg:
+                return msg
+
+    for name, dispatch in (('перебор', linear), ('таблица', client.dispatch)):
+        started = time.perf_counter()
+        for code in codes:
+            dispatch(code)
+        elapsed = time.perf_counter() - started
+        print('%-8s %8.2f мкс на запрос' % (name, elapsed / requests * 1e6))
 
 
 client = Client()
 client.add_handler(Http404Handler())
 client.add_handler(Http500Handler())
+client.add_handler(Http5xxHandler())
 client.response(400)  # Код не обработан
 client.response(404)  # Ответ: Страница не найдена
 client.response(500)  # Ответ: Ошибка сервера
+client.response(503)  # Ответ: Ошибка сервера (503)
+
+if __name__ == '__main__':
+    benchmark()
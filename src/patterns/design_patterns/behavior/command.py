@@ -8,34 +8,76 @@
 а также поддерживать отмену операций.
 """
 
+import asyncio
+import inspect
+import queue
+import struct
+import threading
+import time
+import traceback
+from collections import deque
+
 
 class Light(object):
     def turn_on(self):
-        print 'Включить свет'
+        print('Включить свет')
 
     def turn_off(self):
-        print 'Выключить свет'
+        print('Выключить свет')
 
 
 class CommandBase(object):
+    code = 0  # номер типа команды в журнале отмены
+
+    @property
+    def receiver(self):
+        return None
+
     def execute(self):
         raise NotImplementedError()
 
+    def undo(self):
+        raise NotImplementedError()
+
+    def merge(self, later):
+        """Команда, заменяющая пару (self, later), или None, если их нельзя слить"""
+        return None
+
 
 class LightCommandBase(CommandBase):
     def __init__(self, light):
         self.light = light
 
+    @property
+    def receiver(self):
+        return self.light
+
+    def merge(self, later):
+        # важно только последнее переключение одной и той же лампы
+        if isinstance(later, LightCommandBase) and later.light is self.light:
+            return later
+        return None
+
 
 class TurnOnLightCommand(LightCommandBase):
+    code = 1
+
     def execute(self):
         self.light.turn_on()
 
+    def undo(self):
+        self.light.turn_off()
+
 
 class TurnOffLightCommand(LightCommandBase):
+    code = 2
+
     def execute(self):
         self.light.turn_off()
 
+    def undo(self):
+        self.light.turn_on()
+
 
 class Switch(object):
     def __init__(self, on_cmd, off_cmd):
@@ -49,8 +91,266 @@ class Switch(object):
         self.off_cmd.execute()
 
 
+UNDO_FLAG = 0x8000
+LOG_RECORD = struct.Struct('<QHI')  # номер, код команды (| UNDO_FLAG), номер получателя
+
+
+def read_undo_log(filename):
+    """Записи журнала: (номер, код команды, номер получателя, была ли это отмена).
+
+    Номер получателя - порядковый номер объекта в процессе, записавшем журнал,
+    и после перезапуска ни на что не указывает: журнал годится для аудита и
+    статистики, но не для повторного выполнения или отмены."""
+    with open(filename, 'rb') as f:
+        data = f.read()
+    for seq, code, receiver in LOG_RECORD.iter_unpack(data[:len(data) - len(data) % LOG_RECORD.size]):
+        yield seq, code & ~UNDO_FLAG, receiver, bool(code & UNDO_FLAG)
+
+
+class CommandBus(object):
+    """
+    Шина команд: очередь, пакетное выполнение, журнал отмены.
+
+    submit() кладет команду в ограниченную очередь (и ждет, если она полна).
+    Команды одного получателя всегда попадают к одному рабочему потоку,
+    поэтому порядок для получателя сохраняется. Поток забирает пачку до
+    batch_size команд и сливает команды одного получателя
+    (вкл/выкл/вкл -> вкл); при этом команда может оказаться после команд
+    других получателей, отправленных позже. Выполненные команды
+    дописываются в журнал по 14 байт на запись (LOG_RECORD) и в стек отмены
+    глубиной undo_depth; отменять можно только из стека, журнал - аудит
+    (см. read_undo_log). Код команды должен быть меньше UNDO_FLAG - иначе
+    submit() сразу бросает ValueError. Исключение из execute() или merge()
+    засчитывается в failed и не останавливает рабочий поток.
+    """
+    def __init__(self, workers=4, maxsize=1024, batch_size=256, log_path=None, undo_depth=1000):
+        self.batch_size = batch_size
+        self._queues = [self._make_queue(maxsize) for _ in range(workers)]
+        self._receivers = {}   # id(получателя) -> номер в журнале
+        self._keep = []        # держим получателей, чтобы их id не переиспользовались
+        self._undo = deque(maxlen=undo_depth)
+        self._lock = threading.Lock()
+        self._log = open(log_path, 'ab') if log_path else None
+        self._seq = 0
+        self._started = time.perf_counter()
+        self.submitted = self.executed = self.merged = self.failed = 0
+        self._latency_total = self._latency_max = 0.0
+        self._workers = []
+
+    def _make_queue(self, maxsize):
+        return queue.Queue(maxsize)
+
+    def start(self):
+        for q in self._queues:
+            worker = threading.Thread(target=self._worker, args=(q,), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def _receiver_id(self, receiver):
+        with self._lock:
+            self.submitted += 1
+            rid = self._receivers.get(id(receiver))
+            if rid is None:
+                rid = self._receivers[id(receiver)] = len(self._keep)
+                self._keep.append(receiver)
+            return rid
+
+    def _route(self, command):
+        if not 0 <= command.code < UNDO_FLAG:
+            raise ValueError(f'Код команды {command.code} вне диапазона 0..{UNDO_FLAG - 1}')
+        rid = self._receiver_id(command.receiver)
+        return self._queues[rid % len(self._queues)], (time.perf_counter(), rid, command)
+
+    def submit(self, command):
+        q, item = self._route(command)
+        q.put(item)
+
+    def _worker(self, q):
+        while True:
+            batch = [q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._process([item for item in batch if item is not None])
+            except Exception:
+                self._batch_failed(batch)
+            finally:
+                for _ in batch:
+                    q.task_done()
+            if stop:
+                return
+
+    def _batch_failed(self, batch):
+        # упал merge() или запись журнала: пачка теряется, но рабочий жив,
+        # иначе join(), undo() и close() ждали бы его вечно
+        traceback.print_exc()
+        with self._lock:
+            self.failed += sum(item is not None for item in batch)
+
+    def _coalesce(self, batch):
+        # команды разных получателей независимы, поэтому сливаются команды
+        # одного получателя в пределах пачки, а не только стоящие рядом
+        result, last = [], {}
+        for submitted_at, rid, command in batch:
+            if rid in last:
+                prev_at, _, prev = result[last[rid]]
+                merged = prev.merge(command)
+                if merged is not None:
+                    # задержка считается от самой ранней из слитых команд
+                    result[last[rid]] = (prev_at, rid, merged)
+                    continue
+            last[rid] = len(result)
+            result.append((submitted_at, rid, command))
+        return result
+
+    def _process(self, batch):
+        coalesced = self._coalesce(batch)
+        done = []
+        for submitted_at, rid, command in coalesced:
+            try:
+                command.execute()
+            except Exception:
+                continue
+            done.append((submitted_at, rid, command))
+        self._record(done, merged=len(batch) - len(coalesced), failed=len(coalesced) - len(done))
+
+    def _record(self, done, merged=0, failed=0, undo=False):
+        now = time.perf_counter()
+        with self._lock:
+            records = []
+            for submitted_at, rid, command in done:
+                self._seq += 1
+                if self._log is not None:
+                    code = command.code | (UNDO_FLAG if undo else 0)
+                    records.append(LOG_RECORD.pack(self._seq, code, rid))
+                if not undo:
+                    self._undo.append((rid, command))
+                    latency = now - submitted_at
+                    self._latency_total += latency
+                    self._latency_max = max(self._latency_max, latency)
+            if records:
+                self._log.write(b''.join(records))
+                self._log.flush()
+            if not undo:
+                self.executed += len(done)
+                self.merged += merged
+                self.failed += failed
+
+    def join(self):
+        """Ждет выполнения всего, что уже в очередях"""
+        for q in self._queues:
+            q.join()
+
+    def undo(self, steps=1):
+        """Отменяет последние выполненные команды (сначала дожидается очередей)"""
+        self.join()
+        for _ in range(steps):
+            self._undo_last()
+
+    def _undo_last(self):
+        with self._lock:
+            if not self._undo:
+                raise IndexError('Нечего отменять')
+            rid, command = self._undo.pop()
+        command.undo()
+        self._record([(0.0, rid, command)], undo=True)
+
+    def metrics(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            return {
+                'submitted': self.submitted,
+                'executed': self.executed,
+                'merged': self.merged,
+                'failed': self.failed,
+                # слитые команды тоже обработаны, просто без отдельного вызова
+                'throughput': (self.executed + self.merged) / elapsed if elapsed else 0.0,
+                'avg_latency': self._latency_total / self.executed if self.executed else 0.0,
+                'max_latency': self._latency_max,
+            }
+
+    def close(self):
+        for q in self._queues:
+            q.put(None)
+        for worker in self._workers:
+            worker.join()
+        if self._log is not None:
+            self._log.close()
+
+
+class AsyncCommandBus(CommandBus):
+    """Та же шина на asyncio: рабочие - задачи, execute может быть корутиной"""
+    def _make_queue(self, maxsize):
+        return asyncio.Queue(maxsize)
+
+    async def start(self):
+        self._workers = [asyncio.ensure_future(self._worker(q)) for q in self._queues]
+        return self
+
+    async def submit(self, command):
+        q, item = self._route(command)
+        await q.put(item)
+
+    async def _worker(self, q):
+        while True:
+            batch = [await q.get()]
+            while len(batch) < self.batch_size and not q.empty():
+                batch.append(q.get_nowait())
+            stop = None in batch
+            try:
+                await self._process([item for item in batch if item is not None])
+            except Exception:
+                self._batch_failed(batch)
+            finally:
+                for _ in batch:
+                    q.task_done()
+            if stop:
+                return
+
+    async def _process(self, batch):
+        coalesced = self._coalesce(batch)
+        done = []
+        for submitted_at, rid, command in coalesced:
+            try:
+                result = command.execute()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                continue
+            done.append((submitted_at, rid, command))
+        self._record(done, merged=len(batch) - len(coalesced), failed=len(coalesced) - len(done))
+
+    async def join(self):
+        for q in self._queues:
+            await q.join()
+
+    async def undo(self, steps=1):
+        await self.join()
+        for _ in range(steps):
+            self._undo_last()
+
+    async def close(self):
+        for q in self._queues:
+            await q.put(None)
+        await asyncio.gather(*self._workers)
+        if self._log is not None:
+            self._log.close()
+
+
 light = Light()
 switch = Switch(on_cmd=TurnOnLightCommand(light),
                 off_cmd=TurnOffLightCommand(light))
 switch.on()  # Включить свет
 switch.off()  # Выключить свет
+
+bus = CommandBus(workers=2)
+for cmd in (TurnOnLightCommand(light), TurnOffLightCommand(light), TurnOnLightCommand(light)):
+    bus.submit(cmd)
+bus.start().join()  # Включить свет - три команды одной пачки слились в одну
+bus.undo()  # Выключить свет
+bus.close()
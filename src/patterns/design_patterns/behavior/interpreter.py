@@ -7,36 +7,111 @@
 а также интерпретатор предложений этого языка.
 """
 
+import csv
+import os
+import re
+import tempfile
+import time
+from functools import lru_cache
+
+
+# Грамматика: число = тысячи сотни десятки единицы, каждая часть - одна из
+# фиксированных форм. Таблицы переводят форму разряда в значение.
+def _digit_forms(one, five, ten):
+    forms = ['', one, one * 2, one * 3, one + five, five,
+             five + one, five + one * 2, five + one * 3, one + ten]
+    return {form: value for value, form in enumerate(forms)}
+
+
+_THOUSANDS = {'': 0, 'M': 1, 'MM': 2, 'MMM': 3}
+_HUNDREDS = _digit_forms('C', 'D', 'M')
+_TENS = _digit_forms('X', 'L', 'C')
+_UNITS = _digit_forms('I', 'V', 'X')
+_ROMAN_RE = re.compile(r'(M{0,3})(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})')
+
+MAX_ROMAN = 3999
+
 
 class RomanNumeralInterpreter(object):
     """Интерпретатор римских цифр"""
     def __init__(self):
-        self.grammar = {
-            'I': 1,
-            'V': 5,
-            'X': 10,
-            'L': 50,
-            'C': 100,
-            'D': 500,
-            'M': 1000
-        }
-
-    def interpret(self, text):
-        numbers = map(self.grammar.get, text)  # строки в значения
-        if None in numbers:
+        self._table = None
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def interpret(text):
+        """Значение числа; принимаются только канонические записи 1..3999"""
+        match = _ROMAN_RE.fullmatch(text) if text else None
+        if match is None:
             raise ValueError('Ошибочное значение: %s' % text)
-        result = 0  # накапливаем результат
-        temp = None  # запоминаем последнее значение
-        while numbers:
-            num = numbers.pop(0)
-            if temp is None or temp >= num:
-                result += num
-            else:
-                result += (num - temp * 2)
-            temp = num
-        return result
+        thousands, hundreds, tens, units = match.groups()
+        return (_THOUSANDS[thousands] * 1000 + _HUNDREDS[hundreds] * 100
+                + _TENS[tens] * 10 + _UNITS[units])
+
+    @staticmethod
+    def to_roman(number):
+        if isinstance(number, bool) or not isinstance(number, int) or not 1 <= number <= MAX_ROMAN:
+            raise ValueError('Римской записи нет для: %r' % (number,))
+        return _TO_ROMAN[number]
+
+    def interpret_many(self, texts):
+        """Список значений для итерируемого по строкам.
+
+        Разных канонических чисел всего 3999, поэтому один раз строится
+        полная таблица запись -> значение, и дальше каждое число - один
+        поиск в словаре."""
+        if self._table is None:
+            self._table = {roman: value for value, roman in enumerate(_TO_ROMAN) if value}
+        table = self._table
+        try:
+            return list(map(table.__getitem__, texts))
+        except KeyError as e:
+            raise ValueError('Ошибочное значение: %s' % e.args[0])
+
+    def convert_csv_column(self, src, dst, column):
+        """Копирует CSV, добавляя колонку <column>_value со значениями чисел"""
+        with open(src, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            index = header.index(column)
+            rows = list(reader)
+        values = self.interpret_many(row[index].strip() for row in rows)
+        with open(dst, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(header + [column + '_value'])
+            writer.writerows(row + [value] for row, value in zip(rows, values))
+        return len(rows)
+
+
+def _build_to_roman():
+    by_value = [{v: k for k, v in table.items()}
+                for table in (_THOUSANDS, _HUNDREDS, _TENS, _UNITS)]
+    return [''] + [by_value[0][n // 1000] + by_value[1][n // 100 % 10]
+                   + by_value[2][n // 10 % 10] + by_value[3][n % 10]
+                   for n in range(1, MAX_ROMAN + 1)]
+
+
+_TO_ROMAN = _build_to_roman()  # индекс - значение
+
+
+def benchmark(n=10 ** 6):
+    interp = RomanNumeralInterpreter()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'roman_bench.csv')
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'roman'])
+            writer.writerows((i, interp.to_roman(i * 7 % MAX_ROMAN + 1)) for i in range(n))
+        started = time.perf_counter()
+        interp.convert_csv_column(filename, filename + '.out', 'roman')
+        print('%d чисел из CSV за %.2f с' % (n, time.perf_counter() - started))
 
 
 interp = RomanNumeralInterpreter()
-print interp.interpret('MMMCMXCIX') == 3999  # True
-print interp.interpret('MCMLXXXVIII') == 1988  # True
+print(interp.interpret('MMMCMXCIX') == 3999)  # True
+print(interp.interpret('MCMLXXXVIII') == 1988)  # True
+print(interp.to_roman(1988))  # MCMLXXXVIII
+print(interp.interpret_many(['XIV', 'XL', 'MMXXV']))  # [14, 40, 2025]
+
+if __name__ == '__main__':
+    benchmark()
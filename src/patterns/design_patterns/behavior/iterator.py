@@ -7,6 +7,11 @@
 не раскрывая его внутреннего представления.
 """
 
+import mmap
+import os
+from array import array
+from itertools import islice
+
 
 class IteratorBase(object):
     """Базовый класс итератора"""
@@ -77,6 +82,129 @@ class Iterator(IteratorBase):
         return self._list[index]
 
 
+class ChunkCursor(IteratorBase):
+    """
+    Курсор по блокам любого объекта с buffer protocol: bytes, bytearray,
+    array, mmap, numpy-массива.
+
+    Элементы - memoryview длиной chunk_size элементов буфера, без копирования
+    данных. Методы IteratorBase работают с блоками, выровненными по
+    chunk_size, как Iterator со списком. Для обхода в цикле есть
+    forward()/backward() от текущей позиции: `for` идет вперед,
+    reversed() - с конца к началу; позиция сдвигается по мере обхода.
+    """
+    def __init__(self, buffer, chunk_size=64 * 1024):
+        if chunk_size <= 0:
+            raise ValueError('chunk_size должен быть положительным')
+        view = memoryview(buffer)
+        self._view = view if view.ndim == 1 else view.cast('B')
+        self._len = len(self._view)
+        self._chunk_size = chunk_size
+        self._chunks = -(-self._len // chunk_size)
+        self._pos = 0
+        self._mmap = None
+
+    @classmethod
+    def from_file(cls, filename, chunk_size=1024 * 1024):
+        """Курсор по файлу через mmap: в память читаются только нужные страницы"""
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:  # пустой файл mmap не отображает
+                return cls(b'', chunk_size)
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        cursor = cls(mapped, chunk_size)
+        cursor._mmap = mapped
+        return cursor
+
+    def close(self):
+        """Освобождает буфер; выданные блоки к этому моменту должны быть отпущены"""
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        """Число блоков"""
+        return self._chunks
+
+    # ---------- позиция ----------
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        """Позиция в элементах буфера; whence как у файлов: 0 - от начала, 1 - от текущей, 2 - от конца"""
+        base = (0, self._pos, self._len)[whence]
+        self._pos = min(max(base + offset, 0), self._len)
+        return self._pos
+
+    # ---------- протокол итерации ----------
+    def forward(self):
+        size = self._chunk_size
+        while self._pos < self._len:
+            chunk = self._view[self._pos:self._pos + size]
+            self._pos += len(chunk)
+            yield chunk
+
+    def backward(self):
+        size = self._chunk_size
+        while self._pos > 0:
+            start = max(self._pos - size, 0)
+            chunk = self._view[start:self._pos]
+            self._pos = start
+            yield chunk
+
+    def __iter__(self):
+        return self.forward()
+
+    def __reversed__(self):
+        self.seek(0, 2)
+        return self.backward()
+
+    # ---------- IteratorBase ----------
+    def is_done(self, index):
+        return 0 <= index < self._chunks
+
+    def get_item(self, index):
+        if not self.is_done(index):
+            raise IndexError('Нет блока с индексом: %d' % index)
+        start = index * self._chunk_size
+        return self._view[start:start + self._chunk_size]
+
+    def first(self):
+        return self.get_item(0)
+
+    def last(self):
+        return self.get_item(self._chunks - 1)
+
+    def current_item(self):
+        if self._pos >= self._len:
+            raise IndexError('Курсор в конце буфера')
+        return self._view[self._pos:self._pos + self._chunk_size]
+
+    def next(self):
+        self._pos += self._chunk_size
+        if self._pos >= self._len:
+            self._pos = 0
+        return self.current_item()
+
+    def prev(self):
+        self._pos -= self._chunk_size
+        if self._pos < 0:
+            self._pos = (self._chunks - 1) * self._chunk_size
+        return self.current_item()
+
+
 it = Iterator(['one', 'two', 'three', 'four', 'five'])
-print [it.prev() for i in range(5)]  # ['five', 'four', 'three', 'two', 'one']
-print [it.next() for i in range(5)]  # ['two', 'three', 'four', 'five', 'one']
+print([it.prev() for i in range(5)])  # ['five', 'four', 'three', 'two', 'one']
+print([it.next() for i in range(5)])  # ['two', 'three', 'four', 'five', 'one']
+
+cursor = ChunkCursor(array('d', range(10)), chunk_size=4)
+print([chunk.tolist() for chunk in cursor])  # [[0.0, 1.0, 2.0, 3.0], [4.0, 5.0, 6.0, 7.0], [8.0, 9.0]]
+print([chunk.tolist() for chunk in reversed(cursor)])  # [[6.0, 7.0, 8.0, 9.0], [2.0, 3.0, 4.0, 5.0], [0.0, 1.0]]
+cursor.seek(2)
+print([chunk.tolist() for chunk in islice(cursor, 1)])  # [[2.0, 3.0, 4.0, 5.0]]
+print(cursor.tell(), cursor.get_item(2).tolist())  # 6 [8.0, 9.0]
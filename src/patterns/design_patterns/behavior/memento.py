@@ -7,6 +7,10 @@
 чтобы позднее можно было восстановить в нем объект.
 """
 
+import pickle
+from collections import deque
+from copy import deepcopy
+
 
 class Memento(object):
     """Хранитель"""
@@ -47,15 +51,222 @@ class Originator(object):
         self._state = memento.get_state()
 
 
+# Дельты - кортежи, первый элемент - вид изменения
+REPLACE, DICT, SPLICE, ITEM, BYTES = range(5)
+
+
+def _common_prefix(old, new):
+    """Длина общего начала bytes/bytearray; сравнение срезов идет в C"""
+    old, new = memoryview(old), memoryview(new)
+    lo, hi = 0, min(len(old), len(new))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[lo:mid] == new[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def diff(old, new):
+    """Дельта, превращающая old в new; None - изменений нет.
+
+    Словари и списки сравниваются структурно (рекурсивно), bytes - как
+    одна замена участка между общими началом и концом."""
+    if type(old) is not type(new):
+        return REPLACE, deepcopy(new)
+    if isinstance(new, dict):
+        sets, subs = {}, {}
+        dels = [key for key in old if key not in new]
+        for key, value in new.items():
+            if key not in old:
+                sets[key] = deepcopy(value)
+            elif old[key] != value:
+                sub = diff(old[key], value)
+                if sub[0] == REPLACE:
+                    sets[key] = sub[1]
+                else:
+                    subs[key] = sub
+        return (DICT, sets, dels, subs) if sets or dels or subs else None
+    if isinstance(new, list):
+        if old == new:
+            return None
+        n = min(len(old), len(new))
+        start = 0
+        while start < n and old[start] == new[start]:
+            start += 1
+        end = 0
+        while end < n - start and old[-1 - end] == new[-1 - end]:
+            end += 1
+        old_mid, new_mid = old[start:len(old) - end], new[start:len(new) - end]
+        if len(old_mid) == len(new_mid) == 1:
+            sub = diff(old_mid[0], new_mid[0])
+            if sub[0] != REPLACE:
+                return ITEM, start, sub
+        return SPLICE, start, start + len(old_mid), deepcopy(new_mid)
+    if isinstance(new, (bytes, bytearray)):
+        if old == new:
+            return None
+        start = _common_prefix(old, new)
+        end = _common_prefix(old[start:][::-1], new[start:][::-1])
+        return BYTES, start, len(old) - end, bytes(new[start:len(new) - end])
+    return None if old == new else (REPLACE, deepcopy(new))
+
+
+def patch(target, delta):
+    """Применяет дельту; словари, списки и bytearray меняются на месте.
+
+    Возвращает новое значение (для bytes и REPLACE это другой объект)."""
+    if delta is None:
+        return target
+    kind = delta[0]
+    if kind == REPLACE:
+        return deepcopy(delta[1])
+    if kind == DICT:
+        _, sets, dels, subs = delta
+        for key in dels:
+            del target[key]
+        for key, value in sets.items():
+            target[key] = deepcopy(value)
+        for key, sub in subs.items():
+            target[key] = patch(target[key], sub)
+    elif kind == SPLICE:
+        _, start, stop, items = delta
+        target[start:stop] = deepcopy(items)
+    elif kind == ITEM:
+        _, index, sub = delta
+        target[index] = patch(target[index], sub)
+    elif kind == BYTES:
+        _, start, stop, data = delta
+        if isinstance(target, bytearray):
+            target[start:stop] = data
+        else:
+            target = target[:start] + data + target[stop:]
+    return target
+
+
+def _size(obj):
+    return len(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+class History(object):
+    """
+    Опекун с многоуровневой историей состояний создателя.
+
+    Хранит не снимки, а пары дельт (отмена, повтор) между соседними
+    версиями, поэтому undo/redo стоят O(размер изменения): дельта
+    применяется к состоянию создателя на месте. Каждые checkpoint_every
+    версий сохраняется полная копия, чтобы restore(version) не проходил всю
+    историю. Когда оценка памяти (размер дельт и копий в pickle) превышает
+    budget, забываются самые старые версии.
+    """
+    def __init__(self, originator, checkpoint_every=50, budget=64 * 2 ** 20):
+        self._originator = originator
+        self._checkpoint_every = checkpoint_every
+        self._budget = budget
+        self._shadow = deepcopy(originator.get_state())  # состояние версии _pos
+        self._steps = deque()     # (undo, redo, size) для версий base+1 .. head
+        self._checkpoints = {0: (deepcopy(self._shadow), _size(self._shadow))}
+        self._base = self._pos = 0
+        self._used = self._checkpoints[0][1]
+
+    @property
+    def version(self):
+        return self._pos
+
+    @property
+    def versions(self):
+        return range(self._base, self._base + len(self._steps) + 1)
+
+    def save(self):
+        """Запоминает текущее состояние создателя как новую версию"""
+        state = self._originator.get_state()
+        redo = diff(self._shadow, state)
+        if redo is None:
+            return self._pos
+        undo = diff(state, self._shadow)
+        self._truncate_redo()
+        self._shadow = patch(self._shadow, redo)
+        size = _size(undo) + _size(redo)
+        self._steps.append((undo, redo, size))
+        self._used += size
+        self._pos += 1
+        if self._pos % self._checkpoint_every == 0:
+            copy = deepcopy(self._shadow)
+            self._checkpoints[self._pos] = (copy, _size(copy))
+            self._used += self._checkpoints[self._pos][1]
+        self._evict()
+        return self._pos
+
+    def _truncate_redo(self):
+        while self._base + len(self._steps) > self._pos:
+            self._used -= self._steps.pop()[2]
+        for version in [v for v in self._checkpoints if v > self._pos]:
+            self._used -= self._checkpoints.pop(version)[1]
+
+    def _evict(self):
+        while self._used > self._budget and self._base < self._pos:
+            self._used -= self._steps.popleft()[2]
+            self._base += 1
+            if self._base - 1 in self._checkpoints:
+                self._used -= self._checkpoints.pop(self._base - 1)[1]
+
+    def _apply(self, delta):
+        self._shadow = patch(self._shadow, delta)
+        self._originator.set_state(patch(self._originator.get_state(), delta))
+
+    def undo(self):
+        if self._pos == self._base:
+            raise IndexError('Нечего отменять')
+        self._apply(self._steps[self._pos - self._base - 1][0])
+        self._pos -= 1
+
+    def redo(self):
+        if self._pos == self._base + len(self._steps):
+            raise IndexError('Нечего повторять')
+        self._apply(self._steps[self._pos - self._base][1])
+        self._pos += 1
+
+    def restore(self, version):
+        """Переход к любой версии от ближайшей полной копии или от текущей"""
+        if version not in self.versions:
+            raise IndexError('Версия %d недоступна' % version)
+        start = min([self._pos] + list(self._checkpoints), key=lambda v: abs(v - version))
+        if start != self._pos:
+            self._shadow = deepcopy(self._checkpoints[start][0])
+        for v in range(start, version):
+            self._shadow = patch(self._shadow, self._steps[v - self._base][1])
+        for v in range(start, version, -1):
+            self._shadow = patch(self._shadow, self._steps[v - self._base - 1][0])
+        self._pos = version
+        self._originator.set_state(deepcopy(self._shadow))
+
+
 originator = Originator()
 caretaker = Caretaker()
 
 originator.set_state('on')
-print 'Originator state:', originator.get_state()  # Originator state: on
+print('Originator state:', originator.get_state())  # Originator state: on
 caretaker.set_memento(originator.save_state())
 
 originator.set_state('off')
-print 'Originator change state:', originator.get_state()  # Originator change state: off
+print('Originator change state:', originator.get_state())  # Originator change state: off
 
 originator.restore_state(caretaker.get_memento())
-print 'Originator restore state:', originator.get_state()  # Originator restore state: on
+print('Originator restore state:', originator.get_state())  # Originator restore state: on
+
+document = Originator()
+document.set_state({'title': 'Вопросы', 'questions': [{'q': 'Что такое GIL?', 'a': ''}]})
+history = History(document, checkpoint_every=3)
+for answer in ('Глобальная', 'Глобальная блокировка', 'Глобальная блокировка интерпретатора'):
+    document.get_state()['questions'][0]['a'] = answer  # правка на месте
+    history.save()
+document.get_state()['questions'].append({'q': 'Что такое MRO?', 'a': ''})
+history.save()
+
+history.undo()
+history.undo()
+print(document.get_state()['questions'])  # [{'q': 'Что такое GIL?', 'a': 'Глобальная блокировка'}]
+history.redo()
+history.restore(1)
+print(document.get_state()['questions'][0]['a'])  # Глобальная
@@ -8,6 +8,14 @@
 и автоматически обновляются.
 """
 
+import asyncio
+import inspect
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 
 class Subject(object):
     """Субъект"""
@@ -50,7 +58,148 @@ class Observer(ObserverBase):
         self._name = name
 
     def update(self, data):
-        print '%s: %s' % (self._name, data)
+        print('%s: %s' % (self._name, data))
+
+
+class _Subscription(object):
+    """Очередь и метрики одного подписчика шины"""
+    def __init__(self, observer, schedule, maxsize, coalesce):
+        self.ref = weakref.ref(observer)
+        self.schedule = schedule  # запускает drain/drain_async в нужном режиме
+        self.coalesce = coalesce
+        self.queue = deque(maxlen=maxsize)
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.delivered = self.dropped = self.errors = 0
+        self.latency_total = self.latency_max = 0.0
+
+    def push(self, data):
+        with self.lock:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append((time.perf_counter(), data))
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.schedule(self)
+
+    def take(self):
+        with self.lock:
+            if not self.queue or self.ref() is None:
+                self.queue.clear()
+                self.scheduled = False
+                return None
+            if self.coalesce:
+                # медленный подписчик получает только последнее значение
+                item = self.queue[-1]
+                self.dropped += len(self.queue) - 1
+                self.queue.clear()
+                return item
+            return self.queue.popleft()
+
+    def done(self, published_at, ok):
+        latency = time.perf_counter() - published_at
+        with self.lock:
+            self.delivered += ok
+            self.errors += not ok
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def drain(self):
+        while True:
+            item, observer = self.take(), self.ref()
+            if item is None or observer is None:
+                return
+            try:
+                observer.update(item[1])
+                ok = True
+            except Exception:
+                ok = False
+            self.done(item[0], ok)
+
+    async def drain_async(self):
+        while True:
+            item, observer = self.take(), self.ref()
+            if item is None or observer is None:
+                return
+            try:
+                result = observer.update(item[1])
+                if inspect.isawaitable(result):
+                    await result
+                ok = True
+            except Exception:
+                ok = False
+            self.done(item[0], ok)
+
+    def metrics(self):
+        with self.lock:
+            handled = self.delivered + self.errors
+            return {
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'pending': len(self.queue),
+                'avg_latency': self.latency_total / handled if handled else 0.0,
+                'max_latency': self.latency_max,
+            }
+
+
+class EventBus(Subject):
+    """
+    Субъект-шина событий.
+
+    Наблюдатели хранятся по слабым ссылкам: забытый наблюдатель удаляется
+    сборщиком мусора и сам выпадает из рассылки. set_data только кладет
+    значение в ограниченную очередь каждого подписчика, а доставка идет
+    в режиме подписчика:
+        'sync'   - в потоке издателя, как у Subject;
+        'thread' - в пуле потоков, по одной задаче на подписчика;
+        'async'  - в цикле asyncio (update может быть корутиной).
+    При coalesce=True подписчик, не успевающий за издателем, получает только
+    последнее значение, а пропущенные учитываются в метриках. Исключения
+    наблюдателей не останавливают доставку и тоже считаются в метриках.
+    """
+    MODES = ('sync', 'thread', 'async')
+
+    def __init__(self, max_workers=4):
+        super(EventBus, self).__init__()
+        self._observers = weakref.WeakKeyDictionary()
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._tasks = set()
+
+    def attach(self, observer, mode='thread', maxsize=16, coalesce=True, loop=None):
+        if not isinstance(observer, ObserverBase):
+            raise TypeError()
+        if mode not in self.MODES:
+            raise ValueError('mode должен быть одним из %s' % (self.MODES,))
+        if mode == 'sync':
+            schedule = _Subscription.drain
+        elif mode == 'thread':
+            schedule = lambda sub: self._executor.submit(sub.drain)  # noqa: E731
+        else:
+            loop = loop or asyncio.get_running_loop()
+            schedule = lambda sub: loop.call_soon_threadsafe(self._start_task, loop, sub)  # noqa: E731
+        self._observers[observer] = _Subscription(observer, schedule, maxsize, coalesce)
+
+    def detach(self, observer):
+        del self._observers[observer]
+
+    def _start_task(self, loop, subscription):
+        task = loop.create_task(subscription.drain_async())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def notify(self, data):
+        for subscription in list(self._observers.values()):
+            subscription.push(data)
+
+    def metrics(self, observer):
+        """Доставлено/пропущено/ошибки и задержка от set_data до конца update"""
+        return self._observers[observer].metrics()
+
+    def close(self):
+        """Дожидается доставки в режиме 'thread'"""
+        self._executor.shutdown(wait=True)
 
 
 subject = Subject()
@@ -59,3 +208,21 @@ subject.attach(Observer('Наблюдатель 2'))
 subject.set_data('данные для наблюдателя')
 # Наблюдатель 2: данные для наблюдателя
 # Наблюдатель 1: данные для наблюдателя
+
+
+class SlowObserver(Observer):
+    def update(self, data):
+        time.sleep(0.01)
+        super(SlowObserver, self).update(data)
+
+
+bus = EventBus()
+slow = SlowObserver('Медленный')
+bus.attach(slow, mode='thread')
+bus.attach(Observer('Забытый'))  # ссылок на него нет - сразу выпадает из рассылки
+for i in range(1000):
+    bus.set_data(i)  # не ждет медленного наблюдателя
+bus.close()
+# Медленный: 0
+# Медленный: 999
+print(bus.metrics(slow)['delivered'])  # 2 - промежуточные значения схлопнуты
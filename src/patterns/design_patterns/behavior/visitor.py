@@ -7,25 +7,79 @@
 Паттерн посетитель позволяет определить новую операцию, не изменяя классы этих объектов.
 """
 
-
-class FruitVisitor(object):
+import time
+
+
+class Visitor(object):
+    """
+    Базовый посетитель.
+
+    visit(node) вызывает метод <prefix><ИмяКласса> для ближайшего по MRO
+    класса узла, у которого такой метод есть, иначе метод fallback.
+    Найденный метод кешируется на пару (класс посетителя, класс узла),
+    так что повторные вызовы стоят один поиск в словаре.
+    """
+    prefix = 'visit_'
+    fallback = 'generic_visit'
+    _dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}  # свой кеш у каждого класса посетителя
+
+    @classmethod
+    def _resolve(cls, node_cls):
+        for klass in node_cls.__mro__:
+            method = getattr(cls, cls.prefix + klass.__name__, None)
+            if method is not None:
+                break
+        else:
+            method = getattr(cls, cls.fallback)
+        cls._dispatch[node_cls] = method
+        return method
+
+    def visit(self, node):
+        try:
+            method = self._dispatch[type(node)]
+        except KeyError:
+            method = self._resolve(type(node))
+        return method(self, node)
+
+    def generic_visit(self, node):
+        raise TypeError('Нет метода %s для %s' % (self.prefix + type(node).__name__, type(node)))
+
+    def children(self, node):
+        """Дочерние узлы для traverse; по умолчанию - атрибут children"""
+        return getattr(node, 'children', ())
+
+    def traverse(self, root):
+        """Обход в глубину (сначала узел, потом дети) без рекурсии.
+
+        Генератор результатов visit; глубина дерева ограничена только памятью."""
+        stack = [root]
+        pop, extend, visit, children = stack.pop, stack.extend, self.visit, self.children
+        while stack:
+            node = pop()
+            yield visit(node)
+            extend(reversed(tuple(children(node))))
+
+
+class FruitVisitor(Visitor):
     """Посетитель"""
+    prefix = 'draw_'
+    fallback = 'draw_unknown'
+
     def draw(self, fruit):
-        methods = {
-            Apple: self.draw_apple,
-            Pear: self.draw_pear,
-        }
-        draw = methods.get(type(fruit), self.draw_unknown)
-        draw(fruit)
+        self.visit(fruit)
 
-    def draw_apple(self, fruit):
-        print 'Яблоко'
+    def draw_Apple(self, fruit):
+        print('Яблоко')
 
-    def draw_pear(self, fruit):
-        print 'Груша'
+    def draw_Pear(self, fruit):
+        print('Груша')
 
     def draw_unknown(self, fruit):
-        print 'Фрукт'
+        print('Фрукт')
 
 
 class Fruit(object):
@@ -46,6 +100,34 @@ class Banana(Fruit):
     """Банан"""
 
 
+class GreenApple(Apple):
+    """Зеленое яблоко"""
+
+
+class Basket(Fruit):
+    """Корзина с фруктами"""
+    def __init__(self, *children):
+        self.children = children
+
+
+class WeightVisitor(Visitor):
+    """Считает фрукты в корзинах любой вложенности"""
+    def visit_Basket(self, node):
+        return 0
+
+    def visit_Fruit(self, node):
+        return 1
+
+
+def benchmark(n=10 ** 6):
+    basket = Basket()
+    for _ in range(n):  # цепочка корзин глубиной n: рекурсивный обход упал бы
+        basket = Basket(Apple(), basket)
+    started = time.perf_counter()
+    total = sum(WeightVisitor().traverse(basket))
+    print('%d фруктов, %d узлов за %.2f с' % (total, 2 * n + 1, time.perf_counter() - started))
+
+
 visitor = FruitVisitor()
 
 apple = Apple()
@@ -59,3 +141,11 @@ pear.draw(visitor)
 banana = Banana()
 banana.draw(visitor)
 # Фрукт
+
+GreenApple().draw(visitor)
+# Яблоко
+
+print(sum(WeightVisitor().traverse(Basket(Apple(), Basket(Pear(), Banana())))))  # 3
+
+if __name__ == '__main__':
+    benchmark()
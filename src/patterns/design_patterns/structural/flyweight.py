@@ -6,7 +6,15 @@
 Использует разделение для эффективной поддержки множества мелких объектов.
 """
 
+import random
+import tracemalloc
 import weakref
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class Color(object):
@@ -45,9 +53,130 @@ class Placemark(object):
         return 'Цвет: %s; Координаты: (%0.4f, %0.4f)' % args
 
 
+class PlacemarkView(object):
+    """Метка из PlacemarkStore: выглядит как Placemark, но хранит только индекс"""
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    @property
+    def _latitude(self):
+        return self._store._lat[self._index]
+
+    @property
+    def _longitude(self):
+        return self._store._lon[self._index]
+
+    @property
+    def _color(self):
+        return self._store._palette[self._store._codes[self._index]]
+
+    __str__ = Placemark.__str__
+
+
+class PlacemarkStore(object):
+    """Колоночное хранилище меток.
+
+    Координаты лежат в двух array('d') (по 8 байт на число без объектов
+    float), цвет - код в палитре общих Color из ColorFactory (2 байта на метку).
+    Объекты-метки создаются только по запросу в виде PlacemarkView.
+    """
+    def __init__(self, items=()):
+        self._lat = array('d')
+        self._lon = array('d')
+        self._codes = array('H')
+        self._palette = []       # код -> Color
+        self._code_by_name = {}  # имя цвета -> код
+        self.extend(items)
+
+    @classmethod
+    def from_columns(cls, latitudes, longitudes, color_names):
+        store = cls()
+        store._lat.extend(latitudes)
+        store._lon.extend(longitudes)
+        code = store._code
+        store._codes.extend(code(name) for name in color_names)
+        if not len(store._lat) == len(store._lon) == len(store._codes):
+            raise ValueError('Колонки разной длины')
+        return store
+
+    def _code(self, name):
+        code = self._code_by_name.get(name)
+        if code is None:
+            code = self._code_by_name[name] = len(self._palette)
+            self._palette.append(ColorFactory.get_color(name))
+        return code
+
+    def append(self, latitude, longitude, color_name):
+        self._lat.append(latitude)
+        self._lon.append(longitude)
+        self._codes.append(self._code(color_name))
+
+    def extend(self, items):
+        """Массовое добавление из итерируемого по (широта, долгота, цвет)"""
+        lat_append, lon_append = self._lat.append, self._lon.append
+        code_append, code = self._codes.append, self._code
+        for latitude, longitude, color_name in items:
+            lat_append(latitude)
+            lon_append(longitude)
+            code_append(code(color_name))
+
+    def __len__(self):
+        return len(self._lat)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return PlacemarkView(self, index)
+
+    def __iter__(self):
+        return (PlacemarkView(self, i) for i in range(len(self)))
+
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Индексы меток внутри прямоугольника; с NumPy - без цикла по Python"""
+        if np is not None:
+            lat = np.frombuffer(self._lat, dtype=np.float64)
+            lon = np.frombuffer(self._lon, dtype=np.float64)
+            mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+            return np.flatnonzero(mask).tolist()
+        return [i for i, (lat, lon) in enumerate(zip(self._lat, self._lon))
+                if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon]
+
+
+def benchmark(n=10 ** 7, colors=('green', 'red', 'blue', 'yellow')):
+    """Память на одну метку: объекты Placemark против PlacemarkStore"""
+    def points():
+        rnd = random.Random(0)
+        for i in range(n):
+            yield rnd.uniform(-90, 90), rnd.uniform(-180, 180), colors[i % len(colors)]
+
+    for name, build in (('Placemark', lambda: [Placemark(*p) for p in points()]),
+                        ('PlacemarkStore', lambda: PlacemarkStore(points()))):
+        tracemalloc.start()
+        result = build()
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('%-15s %6.1f байт на метку, %7.1f МБ на %d' % (name, used / n, used / 2 ** 20, n))
+        del result
+
+
 plmrk0 = Placemark(-74.007121, 40.714551, 'green')  # Нью-Йорк
 plmrk1 = Placemark(37.617761, 55.755773, 'green')  # Москва
 
-print plmrk0  # Цвет: green; Координаты: (-74.0071, 40.7146)
-print plmrk1  # Цвет: green; Координаты: (37.6178, 55.7558)
-print plmrk0._color is plmrk1._color  # True
+print(plmrk0)  # Цвет: green; Координаты: (-74.0071, 40.7146)
+print(plmrk1)  # Цвет: green; Координаты: (37.6178, 55.7558)
+print(plmrk0._color is plmrk1._color)  # True
+
+store = PlacemarkStore([(-74.007121, 40.714551, 'green'), (37.617761, 55.755773, 'green')])
+print(store[1])  # Цвет: green; Координаты: (37.6178, 55.7558)
+print(store[0]._color is plmrk0._color)  # True
+print(store.in_bbox(0, 0, 90, 90))  # [1]
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:2] == ['bench']:
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10 ** 7)
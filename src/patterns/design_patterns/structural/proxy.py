@@ -7,7 +7,8 @@
 """
 
 
-from functools import partial
+import json
+from concurrent.futures import ProcessPoolExecutor
 
 
 class ImageBase(object):
@@ -21,6 +22,11 @@ class ImageBase(object):
         """Рисует точку заданным цветом"""
         raise NotImplementedError()
 
+    def draw_points(self, points, color):
+        """Рисует несколько точек одним цветом"""
+        for x, y in points:
+            self.draw(x, y, color)
+
     def fill(self, color):
         """Заливка цветом"""
         raise NotImplementedError()
@@ -37,13 +43,100 @@ class Image(ImageBase):
         self._height = int(height)
 
     def draw(self, x, y, color):
-        print 'Рисуем точку; координаты: (%d, %d); цвет: %s' % (x, y, color)
+        print('Рисуем точку; координаты: (%d, %d); цвет: %s' % (x, y, color))
+
+    def draw_points(self, points, color):
+        coords = ', '.join('(%d, %d)' % point for point in points)
+        print('Рисуем точки (%d) цветом %s: %s' % (len(points), color, coords))
 
     def fill(self, color):
-        print 'Заливка цветом %s' % color
+        print('Заливка цветом %s' % color)
 
     def save(self, filename):
-        print 'Сохраняем изображение в файл %s' % filename
+        print('Сохраняем изображение в файл %s' % filename)
+
+
+FILL, DRAW, POINTS = 0, 1, 2
+
+
+class OperationLog(object):
+    """
+    Журнал отложенных операций над изображением.
+
+    Операции хранятся кортежами (FILL, color) и (DRAW, x, y, color), поэтому
+    журнал легко сериализовать и передать в другой процесс. Перед
+    воспроизведением журнал сжимается: заливка стирает все, что было нарисовано
+    до нее, а идущие подряд точки одного цвета рисуются одним вызовом.
+    """
+    def __init__(self, operations=()):
+        self.operations = list(operations)
+
+    def fill(self, color):
+        self.operations.append((FILL, color))
+
+    def draw(self, x, y, color):
+        self.operations.append((DRAW, x, y, color))
+
+    def coalesced(self):
+        """Сжатый список операций; точки - (POINTS, color, ((x, y), ...))"""
+        start = 0
+        for i, op in enumerate(self.operations):
+            if op[0] == FILL:
+                start = i
+        result = []
+        for op in self.operations[start:]:
+            if op[0] == FILL:
+                result.append(op)
+                continue
+            color, points = (op[3], [op[1:3]]) if op[0] == DRAW else (op[1], list(op[2]))
+            if result and result[-1][0] == POINTS and result[-1][1] == color:
+                result[-1][2].extend(points)
+            else:
+                result.append((POINTS, color, points))
+        return [(POINTS, op[1], tuple(op[2])) if op[0] == POINTS else op for op in result]
+
+    def replay(self, image):
+        """Выполняет сжатый журнал над изображением"""
+        for op in self.coalesced():
+            if op[0] == FILL:
+                image.fill(op[1])
+            else:
+                image.draw_points(op[2], op[1])
+
+    def clear(self):
+        del self.operations[:]
+
+    def dumps(self):
+        return json.dumps(self.operations)
+
+    @classmethod
+    def loads(cls, data):
+        # JSON превращает кортежи в списки
+        return cls((POINTS, op[1], tuple(map(tuple, op[2]))) if op[0] == POINTS else tuple(op)
+                   for op in json.loads(data))
+
+    def __len__(self):
+        return len(self.operations)
+
+
+def render(log, width, height, filename, image_cls=Image):
+    """Применяет журнал к новому изображению и сохраняет его"""
+    image = image_cls.create(width, height)
+    log.replay(image)
+    image.save(filename)
+    return filename
+
+
+def render_many(log, jobs, workers=None):
+    """Применяет один журнал ко многим изображениям в пуле процессов.
+
+    jobs - итерируемое по (width, height, filename); журнал передается
+    сжатым, так что в процессы уходит только нужная работа."""
+    log = OperationLog(log.coalesced())
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render, log, width, height, filename)
+                   for width, height, filename in jobs]
+        return [future.result() for future in futures]
 
 
 class ImageProxy(ImageBase):
@@ -53,24 +146,24 @@ class ImageProxy(ImageBase):
     """
     def __init__(self, *args, **kwargs):
         self._image = Image(*args, **kwargs)
-        self.operations = []
+        self.operations = OperationLog()
 
-    def draw(self, *args):
-        func = partial(self._image.draw, *args)
-        self.operations.append(func)
+    def draw(self, x, y, color):
+        self.operations.draw(x, y, color)
 
-    def fill(self, *args):
-        func = partial(self._image.fill, *args)
-        self.operations.append(func)
+    def fill(self, color):
+        self.operations.fill(color)
 
     def save(self, filename):
         # выполняем все операции над изображением
-        map(lambda f: f(), self.operations)
+        self.operations.replay(self._image)
+        self.operations.clear()
         # сохраняем изображение
         self._image.save(filename)
 
 
 img = ImageProxy(200, 200)
+img.draw(5, 5, 'red')  # будет стерто заливкой
 img.fill('gray')
 img.draw(0, 0, 'green')
 img.draw(0, 1, 'green')
@@ -79,8 +172,13 @@ img.draw(1, 1, 'green')
 img.save('image.png')
 
 # Заливка цветом gray
-# Рисуем точку; координаты: (0, 0); цвет: green
-# Рисуем точку; координаты: (0, 1); цвет: green
-# Рисуем точку; координаты: (1, 0); цвет: green
-# Рисуем точку; координаты: (1, 1); цвет: green
+# Рисуем точки (4) цветом green: (0, 0), (0, 1), (1, 0), (1, 1)
 # Сохраняем изображение в файл image.png
+
+if __name__ == '__main__':
+    log = OperationLog()
+    log.fill('white')
+    for i in range(3):
+        log.draw(i, i, 'black')
+    log = OperationLog.loads(log.dumps())
+    render_many(log, [(100, 100, 'thumb_%d.png' % i) for i in range(3)], workers=2)